@@ -0,0 +1,123 @@
+import argparse
+import os
+import random
+
+words = (
+    "ring shire elf dwarf hobbit wizard mountain river forest tower sword song "
+    "road shadow light king steward ranger horse bridge gate fire star moon "
+    "council journey fellowship burden hope valley hall lore map tale"
+).split()
+
+default_mix = {
+    "heading": 2,
+    "paragraph": 8,
+    "unordered_list": 2,
+    "ordered_list": 1,
+    "quote": 1,
+    "code": 1,
+}
+
+class Corpus:
+    def __init__(self, seed=0, mix=None, image_urls=None):
+        self.random = random.Random(seed)
+        self.mix = dict(default_mix if mix is None else mix)
+        self.image_urls = image_urls or ["/images/tolkien.png", "/images/tom.png"]
+
+    def _words(self, low, high):
+        return " ".join(self.random.choice(words) for _ in range(self.random.randint(low, high)))
+
+    def _inline(self):
+        kind = self.random.randrange(8)
+        text = self._words(1, 3)
+        match kind:
+            case 0:
+                return f"**{text}**"
+            case 1:
+                return f"_{text}_"
+            case 2:
+                return f"`{text}`"
+            case 3:
+                return f"[{text}](/{self.random.choice(words)}/{self.random.choice(words)})"
+            case 4:
+                return f"![{text}]({self.random.choice(self.image_urls)})"
+            case _:
+                return text
+
+    def _sentence(self):
+        parts = [self._words(3, 10)]
+        for _ in range(self.random.randint(0, 3)):
+            parts.append(self._inline())
+            parts.append(self._words(2, 8))
+        return " ".join(parts) + "."
+
+    def block(self, kind):
+        match kind:
+            case "heading":
+                return f"{'#' * self.random.randint(2, 6)} {self._words(2, 6)}"
+            case "paragraph":
+                return "\n".join(self._sentence() for _ in range(self.random.randint(1, 4)))
+            case "unordered_list":
+                return "\n".join(f"- {self._sentence()}" for _ in range(self.random.randint(2, 6)))
+            case "ordered_list":
+                return "\n".join(f"{i + 1}. {self._sentence()}" for i in range(self.random.randint(2, 6)))
+            case "quote":
+                return "\n".join(f"> {self._sentence()}" for _ in range(self.random.randint(1, 3)))
+            case "code":
+                lines = "\n".join(f"    {self._words(2, 6)}()" for _ in range(self.random.randint(2, 8)))
+                return f"```\n{lines}\n```"
+        raise ValueError(f"Invalid block kind: {kind}")
+
+    def page(self, blocks):
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        md_blocks = [f"# {self._words(2, 6).title()}"]
+        for kind in self.random.choices(kinds, weights, k=blocks):
+            md_blocks.append(self.block(kind))
+        return "\n\n".join(md_blocks) + "\n"
+
+    def page_path(self, index, depth):
+        dirs = [f"{self.random.choice(words)}-{self.random.randrange(8)}" for _ in range(self.random.randint(0, depth))]
+        return os.path.join(*dirs, f"page-{index}", "index.md")
+
+def corpus_generate(dest_dir, pages=100, blocks=40, depth=3, large_pages=0, large_blocks=20000, seed=0, mix=None):
+    corpus = Corpus(seed, mix)
+    paths = []
+    for index in range(pages + large_pages):
+        rel_path = "index.md" if index == 0 else corpus.page_path(index, depth)
+        page_blocks = large_blocks if index >= pages else blocks
+        path = os.path.join(dest_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as md_file:
+            md_file.write(corpus.page(page_blocks))
+        paths.append(path)
+    return paths
+
+def mix_parse(text):
+    mix = {}
+    for item in text.split(","):
+        kind, weight = item.split("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+def args_parse():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic markdown corpus.")
+    parser.add_argument("dest_dir", help="directory to write markdown pages into")
+    parser.add_argument("--pages", type=int, default=100, help="number of regular pages")
+    parser.add_argument("--blocks", type=int, default=40, help="blocks per regular page")
+    parser.add_argument("--depth", type=int, default=3, help="maximum directory nesting")
+    parser.add_argument("--large-pages", type=int, default=0, help="number of very large pages")
+    parser.add_argument("--large-blocks", type=int, default=20000, help="blocks per large page")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--mix", type=mix_parse, default=None, help="block weights, e.g. paragraph=8,code=1")
+    return parser.parse_args()
+
+def main():
+    args = args_parse()
+    paths = corpus_generate(
+        args.dest_dir, args.pages, args.blocks, args.depth,
+        args.large_pages, args.large_blocks, args.seed, args.mix,
+    )
+    print(f"Generated {len(paths)} pages in {args.dest_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import re
+import sys
+import time
+from md_inline import _md_inline_to_md_nodes
+from md_node import MdNode, MdType
+
+# the re.split + per-token re.fullmatch tokenizer _md_inline_to_md_nodes replaced
+legacy_regex_map = [
+    { "type": MdType.BOLD, "symbol": "**", "pattern": r"\*\*(?:.*?)\*\*" },
+    { "type": MdType.ITALIC, "symbol": "_", "pattern": r"\_(?:.*?)\_" },
+    { "type": MdType.CODE, "symbol": "`", "pattern": r"\`(?:.*?)\`" },
+    { "type": MdType.LINK, "symbol": "", "pattern": r"(?<!!)\[(?:.*?)\]\((?:.*?)\)" },
+    { "type": MdType.IMAGE, "symbol": "!", "pattern": r"!\[(?:.*?)\]\((?:.*?)\)" }
+]
+
+def legacy_md_inline_to_md_nodes(md):
+    patterns = "|".join(f"({item['pattern']})" for item in legacy_regex_map)
+    md_split = re.split(patterns, md)
+    md_split = [t for t in md_split if t]
+    return list(map(_legacy_to_md_node, md_split))
+
+def _legacy_to_md_node(md):
+    match_and_generate = (
+         _legacy_md_node_generate(md, md_regex["type"], md_regex["symbol"])
+        for md_regex in legacy_regex_map
+        if re.fullmatch(md_regex["pattern"], md)
+    )
+    return next(match_and_generate, MdNode(md, MdType.TEXT))
+
+def _legacy_md_node_generate(md, type, symbol):
+    match type:
+        case MdType.BOLD | MdType.ITALIC | MdType.CODE:
+            return MdNode(md.strip(symbol), type)
+        case MdType.LINK | MdType.IMAGE:
+            md_alt, md_url = md.lstrip(symbol + "[").rstrip(")]").split("](")
+            return MdNode(md_alt, type, md_url)
+        case _:
+            return MdNode(md, MdType.TEXT)
+
+sample_lines = [
+    "This is **bold** text with _italic_ and `code` spans.",
+    "See [the docs](https://example.com/docs) and ![a diagram](/images/diagram.png) for details.",
+    "Plain prose without any inline markup at all, which is the common case for long posts.",
+    "Mixing **strong**, _emphasis_, `inline code`, [links](/blog/post) and more **strong** text.",
+]
+
+def bench(tokenize, lines, repeat):
+    tokens = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            tokens += len(tokenize(line))
+    elapsed = time.perf_counter() - start
+    return tokens, elapsed
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, tokenize in (
+        ("legacy", legacy_md_inline_to_md_nodes),
+        ("scanner", _md_inline_to_md_nodes),
+    ):
+        tokens, elapsed = bench(tokenize, sample_lines, repeat)
+        print(f"{name:>8}: {tokens} tokens in {elapsed:.3f}s ({tokens / elapsed:,.0f} tokens/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from corpus import corpus_generate, mix_parse
+from md_block import _md_inline_to_md_blocks
+from md_inline import _md_inline_to_md_nodes, md_inline_to_html_node
+from page_gen import page_generate, pages_generate
+from page_template import PageTemplate
+
+def peak_rss_kb():
+    # the peak of this process and of the largest worker it waited for
+    usage_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(usage_self, usage_children)
+
+def md_paths(src_dir):
+    paths = []
+    for root, _, files in os.walk(src_dir):
+        paths.extend(os.path.join(root, file) for file in files if file.endswith(".md"))
+    return sorted(paths)
+
+def md_docs(paths):
+    docs = []
+    for path in paths:
+        with open(path, "r") as md_file:
+            docs.append(md_file.read())
+    return docs
+
+def stage_setup(name, src_dir, template_path, base_path, dest_root, jobs):
+    # builds only the inputs the stage uses, returns it with the number of
+    # items it processes
+    paths = md_paths(src_dir)
+    if name == "md_inline_to_md_blocks":
+        docs = md_docs(paths)
+        return (lambda: [_md_inline_to_md_blocks(doc) for doc in docs]), len(docs)
+    if name == "md_inline_to_md_nodes":
+        blocks = [block for doc in md_docs(paths) for block in _md_inline_to_md_blocks(doc)]
+        return (lambda: [_md_inline_to_md_nodes(block) for block in blocks]), len(blocks)
+    if name == "parent_node_to_html":
+        html_nodes = [md_inline_to_html_node(doc) for doc in md_docs(paths)]
+        return (lambda: [node.to_html() for node in html_nodes]), len(html_nodes)
+    if name == "page_generate":
+        template = PageTemplate.load(template_path, base_path)
+
+        def pages_each():
+            for path in paths:
+                rel_path = os.path.relpath(path, src_dir).replace(".md", ".html")
+                page_generate(base_path, template_path, path, os.path.join(dest_root, "page", rel_path), template)
+        return pages_each, len(paths)
+    if name == "pages_generate":
+        def pages_all():
+            dest_dir = os.path.join(dest_root, "site")
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            pages_generate(base_path, template_path, src_dir, dest_dir, jobs=jobs)
+        return pages_all, len(paths)
+    raise ValueError(f"unknown stage: {name}")
+
+def stage_measure(connection, name, pages, nbytes, repeat, *setup_args):
+    # runs in a fresh process, so its peak RSS is its own inputs and work
+    run, items = stage_setup(name, *setup_args)
+    setup_rss_kb = peak_rss_kb()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    connection.send({
+        "stage": name,
+        "items": items,
+        "seconds": round(best, 6),
+        "pages_per_s": round(pages / best, 2) if best else None,
+        "mb_per_s": round(nbytes / best / 1e6, 3) if best else None,
+        "setup_rss_kb": setup_rss_kb,
+        "peak_rss_kb": peak_rss_kb(),
+    })
+    connection.close()
+
+def stage_run(name, pages, nbytes, repeat, *setup_args):
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=stage_measure, args=(sender, name, pages, nbytes, repeat, *setup_args))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"stage {name} failed")
+    finally:
+        process.join()
+    return result
+
+def bench_run(src_dir, template_path, base_path="", jobs=1, repeat=1):
+    paths = md_paths(src_dir)
+    nbytes = sum(os.path.getsize(path) for path in paths)
+    stages = ["md_inline_to_md_blocks", "md_inline_to_md_nodes", "parent_node_to_html", "page_generate", "pages_generate"]
+
+    dest_root = tempfile.mkdtemp(prefix="ssg-bench-")
+    try:
+        results = [
+            stage_run(name, len(paths), nbytes, repeat, src_dir, template_path, base_path, dest_root, jobs)
+            for name in stages
+        ]
+    finally:
+        shutil.rmtree(dest_root, ignore_errors=True)
+
+    return {
+        "pages": len(paths),
+        "bytes": nbytes,
+        "blocks": next(result["items"] for result in results if result["stage"] == "md_inline_to_md_nodes"),
+        "jobs": jobs,
+        "repeat": repeat,
+        "stages": results,
+    }
+
+def args_parse():
+    parser = argparse.ArgumentParser(description="Benchmark the generator over a synthetic corpus.")
+    parser.add_argument("--src-dir", default=None, help="benchmark an existing content tree instead of a synthetic one")
+    parser.add_argument("--template", default="template.html", help="template used for page generation")
+    parser.add_argument("--pages", type=int, default=200, help="number of regular pages")
+    parser.add_argument("--blocks", type=int, default=40, help="blocks per regular page")
+    parser.add_argument("--depth", type=int, default=3, help="maximum directory nesting")
+    parser.add_argument("--large-pages", type=int, default=1, help="number of very large pages")
+    parser.add_argument("--large-blocks", type=int, default=20000, help="blocks per large page")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--mix", type=mix_parse, default=None, help="block weights, e.g. paragraph=8,code=1")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="processes used by pages_generate")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest is reported")
+    parser.add_argument("-o", "--output", default=None, help="write the JSON report to this file")
+    return parser.parse_args()
+
+def main():
+    args = args_parse()
+    corpus_dir = None
+    src_dir = args.src_dir
+    if src_dir is None:
+        corpus_dir = tempfile.mkdtemp(prefix="ssg-corpus-")
+        src_dir = corpus_dir
+        corpus_generate(
+            src_dir, args.pages, args.blocks, args.depth,
+            args.large_pages, args.large_blocks, args.seed, args.mix,
+        )
+    try:
+        report = bench_run(src_dir, args.template, jobs=args.jobs, repeat=args.repeat)
+    finally:
+        if corpus_dir is not None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+    report["corpus"] = {
+        "src_dir": args.src_dir,
+        "seed": args.seed,
+        "pages": args.pages,
+        "blocks": args.blocks,
+        "depth": args.depth,
+        "large_pages": args.large_pages,
+        "large_blocks": args.large_blocks,
+        "mix": args.mix,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
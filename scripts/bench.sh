@@ -0,0 +1 @@
+PYTHONPATH=src python3 bench/run.py "$@"
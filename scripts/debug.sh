@@ -1,2 +1 @@
-python3 src/entry_point.py "" "public/"
-cd public && python3 -m http.server 8888
\ No newline at end of file
+python3 src/serve.py --port 8888
\ No newline at end of file
@@ -0,0 +1,123 @@
+
+import os
+import pickle
+import sqlite3
+import time
+from manifest import hash_str
+from md_inline import _md_block_to_html_parent_node, parser_version
+
+# one connection per process and database, worker processes get the memo
+# pickled with every page and reopen it lazily
+_connections = {}
+# pending writes are flushed past either limit, a page of unique blocks
+# doesn't hold every pickled tree until it ends
+flush_bytes = 4 * 1024 * 1024
+flush_blocks = 1024
+
+def _journal_wal(connection, attempts=100):
+    # switching a new file to WAL ignores the busy timeout while another
+    # worker is opening it too, so it is retried
+    for attempt in range(attempts):
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.01)
+
+class BlockMemo:
+    # rendered block nodes keyed by the raw block text, shared by every process
+    # through sqlite. small blocks parse faster than they can be looked up.
+    def __init__(self, path, max_entries=50000, min_block=256):
+        self.path = path
+        self.max_entries = max_entries
+        self.min_block = min_block
+        self.stats = { "hits": 0, "misses": 0, "evictions": 0 }
+        self._stored = []
+        self._stored_bytes = 0
+        self._used = []
+
+    def __getstate__(self):
+        return { "path": self.path, "max_entries": self.max_entries, "min_block": self.min_block }
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["max_entries"], state["min_block"])
+
+    def _connection(self):
+        key = (self.path, os.getpid())
+        connection = _connections.get(key)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            _journal_wal(connection)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blocks (key TEXT PRIMARY KEY, node BLOB NOT NULL, used INTEGER NOT NULL)"
+            )
+            _connections[key] = connection
+        return connection
+
+    def render(self, block, type=None):
+        if len(block) < self.min_block:
+            return _md_block_to_html_parent_node(block, type)
+        key = hash_str(f"{parser_version}:{block}")
+        row = self._connection().execute("SELECT node FROM blocks WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.stats["hits"] += 1
+            self._used.append(key)
+            if len(self._used) >= flush_blocks:
+                self.flush()
+            # every hit unpickles a fresh tree, pages rewrite urls in place
+            return pickle.loads(row[0])
+        self.stats["misses"] += 1
+        html_node = _md_block_to_html_parent_node(block, type)
+        node = pickle.dumps(html_node, pickle.HIGHEST_PROTOCOL)
+        self._stored.append((key, node))
+        self._stored_bytes += len(node)
+        if self._stored_bytes >= flush_bytes or len(self._stored) >= flush_blocks:
+            self.flush()
+        return html_node
+
+    def flush(self):
+        # new blocks and last uses are written in batches, at the latest when
+        # the page ends
+        if not self._stored and not self._used:
+            return
+        now = time.time_ns()
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO blocks (key, node, used) VALUES (?, ?, ?)",
+                [(key, node, now) for key, node in self._stored],
+            )
+            connection.executemany("UPDATE blocks SET used = ? WHERE key = ?", [(now, key) for key in self._used])
+        self._stored = []
+        self._stored_bytes = 0
+        self._used = []
+
+    def evict(self):
+        if not os.path.exists(self.path):
+            return 0
+        with self._connection() as connection:
+            count = connection.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+            if count <= self.max_entries:
+                return 0
+            evicted = count - self.max_entries
+            connection.execute(
+                "DELETE FROM blocks WHERE key IN (SELECT key FROM blocks ORDER BY used LIMIT ?)",
+                (evicted,),
+            )
+        self.stats["evictions"] += evicted
+        return evicted
+
+    def stats_drain(self):
+        stats = self.stats
+        self.stats = { "hits": 0, "misses": 0, "evictions": 0 }
+        return stats
+
+    def stats_merge(self, stats):
+        for name, value in stats.items():
+            self.stats[name] += value
+
+    def __repr__(self):
+        return f"BlockMemo({self.path}, {self.max_entries} entries)"
@@ -0,0 +1,88 @@
+
+import gzip
+import instrument
+import os
+from concurrent.futures import ThreadPoolExecutor
+from manifest import hash_file, manifest_load, manifest_save
+
+compressible_exts = { ".html", ".css", ".js", ".json", ".svg", ".txt", ".xml" }
+
+def directory_compress(dest_dir, jobs=4, min_size=1024):
+    entries = manifest_load(dest_dir, "compress")
+
+    files = {}
+    pending = []
+    unchanged = 0
+    for rel_path in _files_compressible(dest_dir):
+        path = os.path.join(dest_dir, rel_path)
+        if os.path.getsize(path) < min_size:
+            continue
+        file_hash = hash_file(path)
+        files[rel_path] = file_hash
+        if entries.get(rel_path) == file_hash and os.path.exists(path + ".gz"):
+            unchanged += 1
+        else:
+            pending.append(path)
+
+    removed = 0
+    for rel_path in entries:
+        if rel_path in files:
+            continue
+        sidecar_path = os.path.join(dest_dir, rel_path) + ".gz"
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+            removed += 1
+
+    # zlib releases the gil while compressing, threads are enough
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        sizes = list(executor.map(file_compress, pending))
+
+    manifest_save(dest_dir, "compress", files)
+    original = sum(size[0] for size in sizes)
+    compressed = sum(size[1] for size in sizes)
+    print(
+        f"Compressed {len(pending)} file(s) ({original} -> {compressed} bytes), "
+        f"{unchanged} unchanged, {removed} removed"
+    )
+
+def sidecars_remove(dest_dir):
+    # a build without compression would otherwise leave stale sidecars that
+    # a precompressed server keeps serving
+    entries = manifest_load(dest_dir, "compress")
+    if not entries:
+        return
+    removed = 0
+    for rel_path in entries:
+        sidecar_path = os.path.join(dest_dir, rel_path) + ".gz"
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+            removed += 1
+    manifest_save(dest_dir, "compress", {})
+    print(f"Removed {removed} compressed sidecar(s)")
+
+def file_compress(path):
+    with instrument.span("compress.gzip") as gzip_span:
+        with open(path, "rb") as src_file:
+            data = src_file.read()
+        sidecar_path = path + ".gz"
+        tmp_path = sidecar_path + ".tmp"
+        # a fixed mtime and no file name keep the sidecar reproducible
+        with open(tmp_path, "wb") as tmp_file:
+            with gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=tmp_file, mtime=0) as gzip_file:
+                gzip_file.write(data)
+        os.replace(tmp_path, sidecar_path)
+        gzip_span.bytes_add(len(data))
+    return len(data), os.path.getsize(sidecar_path)
+
+def _files_compressible(dest_dir, rel_dir=""):
+    files = []
+    for item in sorted(os.listdir(os.path.join(dest_dir, rel_dir))):
+        if item.startswith("."):
+            continue
+        rel_path = os.path.join(rel_dir, item)
+        path = os.path.join(dest_dir, rel_path)
+        if os.path.isdir(path):
+            files.extend(_files_compressible(dest_dir, rel_path))
+        elif os.path.splitext(item)[1] in compressible_exts:
+            files.append(rel_path)
+    return files
@@ -1,20 +1,96 @@
 
-import sys
+import argparse
+import instrument
+from block_memo import BlockMemo
+from compress import directory_compress, sidecars_remove
+from fragment_cache import FragmentCache
 from page_gen import pages_generate
-from static_copy import directory_clear, directory_copy
+from shard import shard_parse
+from static_copy import directory_sync, file_transfers
+from watch import watch
 
 static_dir = "static/"
 src_dir = "content/"
 template_path = "template.html"
+cache_dir = ".cache/fragments"
+block_memo_path = ".cache/blocks.sqlite"
+
+def args_parse():
+    parser = argparse.ArgumentParser(description="Generate a static site from markdown content.")
+    parser.add_argument("base_path", help="prefix for root-relative href/src urls")
+    parser.add_argument("dest_dir", help="output directory")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes used to render pages")
+    parser.add_argument("--static-mode", choices=sorted(file_transfers), default="copy", help="how changed static files are placed in the output")
+    parser.add_argument("--static-checksum", action="store_true", help="compare static files by content hash when size or mtime changed")
+    parser.add_argument("--fingerprint", action="store_true", help="give static files content-hashed names and rewrite references to them")
+    parser.add_argument("--image-attrs", action="store_true", help="add width/height read from image headers and lazy loading to page images")
+    parser.add_argument("--search", action="store_true", help="write a sharded search index of page titles, headings and text")
+    parser.add_argument("--blog-index", action="store_true", help="keep page metadata in sqlite and generate paginated listings of content/blog")
+    parser.add_argument("--minify", action="store_true", help="collapse template whitespace and minify css from the static directory")
+    parser.add_argument("--inline-css", action="store_true", help="inline small stylesheets into the page head and preload larger ones and each page's first image")
+    parser.add_argument("--inline-css-max-size", type=int, default=4096, help="largest stylesheet in bytes that gets inlined")
+    parser.add_argument("--compress", action="store_true", help="write .gz sidecars for compressible output files")
+    parser.add_argument("--compress-min-size", type=int, default=1024, help="smallest file in bytes that gets a .gz sidecar")
+    parser.add_argument("--shard", metavar="I/N", type=shard_parse, default=None, help="build only shard I of N, combine the shards with src/merge.py")
+    parser.add_argument("--watch", action="store_true", help="rebuild affected pages and assets when sources change")
+    parser.add_argument("--cache-dir", default=cache_dir, help="where rendered page fragments are cached")
+    parser.add_argument("--cache-size", type=int, default=512, help="fragment cache size limit in MB")
+    parser.add_argument("--no-cache", action="store_true", help="always parse markdown, ignoring the fragment cache")
+    parser.add_argument("--block-memo", nargs="?", const=block_memo_path, default=None, metavar="PATH", help=f"memoize rendered blocks across pages in a sqlite file (default {block_memo_path}), for sites sharing large blocks")
+    parser.add_argument("--block-memo-size", type=int, default=50000, help="most blocks kept in the block memo")
+    parser.add_argument("--profile", metavar="TRACE", default=None, help="write per-stage timings as a chrome trace-event file")
+    args = parser.parse_args()
+    if args.shard is not None and args.watch:
+        parser.error("--shard builds can't be watched")
+    if args.shard is not None and args.blog_index:
+        parser.error("--blog-index needs every page, it can't be combined with --shard")
+    return args
 
 def main():
-    base_path = sys.argv[1]
-    dest_dir = sys.argv[2]
+    args = args_parse()
+    base_path = args.base_path
+    dest_dir = args.dest_dir
+    if args.profile is not None:
+        instrument.enable()
+    cache = None
+    if not args.no_cache:
+        cache = FragmentCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    memo = None
+    if args.block_memo is not None:
+        memo = BlockMemo(args.block_memo, args.block_memo_size)
    
-    directory_clear(dest_dir)
-    directory_copy(static_dir, dest_dir)
+    assets = directory_sync(
+        static_dir, dest_dir,
+        mode=args.static_mode, checksum=args.static_checksum, fingerprint=args.fingerprint,
+        minify=args.minify, shard=args.shard,
+    )
+
+    pages_generate(
+        base_path, template_path, src_dir, dest_dir,
+        jobs=args.jobs, cache=cache, assets=assets, minify=args.minify, images=static_dir if args.image_attrs else None,
+        search=args.search, memo=memo, shard=args.shard, index=args.blog_index,
+        css_dir=static_dir if args.inline_css else None, css_inline_max=args.inline_css_max_size,
+    )
+
+    if args.compress:
+        directory_compress(dest_dir, jobs=max(args.jobs, 4), min_size=args.compress_min_size)
+    else:
+        sidecars_remove(dest_dir)
+
+    if args.profile is not None:
+        instrument.trace_write(args.profile)
+        print(f"Wrote build trace to {args.profile}, slowest pages:")
+        print(instrument.summary())
 
-    pages_generate(base_path, template_path, src_dir, dest_dir)
+    if args.watch:
+        watch(
+            base_path, template_path, src_dir, static_dir, dest_dir,
+            jobs=args.jobs, static_mode=args.static_mode, static_checksum=args.static_checksum,
+            fingerprint=args.fingerprint, minify=args.minify, images=static_dir if args.image_attrs else None,
+            search=args.search, index=args.blog_index, css_inline_max=args.inline_css_max_size if args.inline_css else None,
+            cache=cache, memo=memo,
+            compress_min_size=args.compress_min_size if args.compress else None,
+        )
    
 if __name__ == "__main__":
     main()
\ No newline at end of file
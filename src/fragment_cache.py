@@ -0,0 +1,80 @@
+
+import os
+import pickle
+from manifest import hash_str
+from md_inline import parser_version
+
+class FragmentCache:
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, src_hash):
+        key = hash_str(f"{parser_version}:{src_hash}")
+        return os.path.join(self.cache_dir, key[:2], key + ".pickle")
+
+    def get(self, src_hash):
+        path = self._path(src_hash)
+        try:
+            cache_file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            header = pickle.load(cache_file)
+        except Exception:
+            cache_file.close()
+            return None
+        # the mtime doubles as the last use for eviction
+        os.utime(path)
+        return header["title"], self._html_nodes(cache_file)
+
+    def _html_nodes(self, cache_file):
+        with cache_file:
+            while True:
+                try:
+                    yield pickle.load(cache_file)
+                except EOFError:
+                    return
+
+    def store(self, src_hash, title, html_nodes):
+        # tee the block nodes into the cache as they are rendered, before any
+        # url rewriting, and only keep the entry when every block made it
+        path = self._path(src_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        complete = False
+        try:
+            with open(tmp_path, "wb") as cache_file:
+                pickle.dump({ "title": title }, cache_file, pickle.HIGHEST_PROTOCOL)
+                for html_node in html_nodes:
+                    pickle.dump(html_node, cache_file, pickle.HIGHEST_PROTOCOL)
+                    yield html_node
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp_path, path)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self):
+        if not os.path.exists(self.cache_dir):
+            return 0
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+                total += stat.st_size
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def __repr__(self):
+        return f"FragmentCache({self.cache_dir}, {self.max_bytes} bytes)"
@@ -2,6 +2,8 @@
 
 
 class HTMLNode:
+    __slots__ = ("tag", "value", "children", "props")
+
     def __init__(self, tag = None, value = None, children = None, props = None):
         self.tag = tag
         self.value = value
@@ -10,6 +12,12 @@ class HTMLNode:
 
     def to_html(self):
         raise NotImplementedError("to_html to implemented")
+
+    def html_chunks(self):
+        yield self.to_html()
+
+    def write_html(self, fp):
+        fp.writelines(self.html_chunks())
     
     def props_to_html(self):
         if self.props is None:
@@ -22,6 +30,8 @@ class HTMLNode:
         return f"HTMLNode({self.tag}, {self.value}, children: {self.children}, {self.props})" 
     
 class LeafNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag, value, props=None):
         super().__init__(tag, value, None, props)
 
@@ -35,16 +45,20 @@ class LeafNode(HTMLNode):
         return f"<{self.tag}{self.props_to_html()}>{self.value}</{self.tag}>"
 
 class ParentNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag, children, props=None):
         super().__init__(tag, None, children, props)
 
     def to_html(self):
+        return "".join(self.html_chunks())
+
+    def html_chunks(self):
         if self.tag is None:
             raise ValueError("all parent nodes must have a tag")
         if self.children is None:
             raise ValueError("all parent nodes must have a child")
-        children = ""
+        yield f"<{self.tag}{self.props_to_html()}>"
         for child in self.children:
-            
-            children = children + child.to_html()
-        return f"<{self.tag}{self.props_to_html()}>{children}</{self.tag}>"
\ No newline at end of file
+            yield from child.html_chunks()
+        yield f"</{self.tag}>"
@@ -0,0 +1,107 @@
+
+import instrument
+import os
+import struct
+
+png_signature = b"\x89PNG\r\n\x1a\n"
+# start-of-frame markers carry the size, c4/c8/cc share the range but don't
+jpeg_sof_markers = set(range(0xc0, 0xd0)) - { 0xc4, 0xc8, 0xcc }
+jpeg_standalone_markers = set(range(0xd0, 0xda)) | { 0x01 }
+
+def image_size(path):
+    # only the header is read, nothing is decoded
+    with instrument.span("image_size.read"):
+        with open(path, "rb") as image_file:
+            head = image_file.read(32)
+            if head.startswith(png_signature) and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return _webp_size(head)
+            if head[:2] == b"\xff\xd8":
+                image_file.seek(2)
+                return _jpeg_size(image_file)
+    return None
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b"VP8L" and head[20] == 0x2f:
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+def _jpeg_size(image_file):
+    while True:
+        byte = image_file.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = image_file.read(1)
+        # 0xff may be repeated as padding before the marker
+        while marker == b"\xff":
+            marker = image_file.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker in jpeg_standalone_markers:
+            continue
+        length_bytes = image_file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in jpeg_sof_markers:
+            segment = image_file.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack(">HH", segment[1:5])
+            return width, height
+        image_file.seek(length - 2, os.SEEK_CUR)
+
+class ImageSizes:
+    # sizes of images under root_dir by url, kept per relative path with the
+    # mtime they were read at so entries can be saved and trusted next build
+    def __init__(self, root_dir, entries=None):
+        self.root_dir = root_dir
+        self.entries = entries if entries is not None else {}
+        # entries read since the last drain, a worker process hands them back
+        # to the parent that saves the manifest
+        self.read = {}
+
+    def rel_path(self, url):
+        if not url.startswith("/") or url.startswith("//"):
+            return None
+        return url.split("#")[0].split("?")[0].lstrip("/")
+
+    def size(self, rel_path):
+        path = os.path.join(self.root_dir, rel_path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.entries.get(rel_path)
+        if entry is None or entry[0] != mtime:
+            try:
+                size = image_size(path)
+            except OSError:
+                size = None
+            entry = [mtime, *size] if size is not None else [mtime, None, None]
+            self.entries[rel_path] = entry
+            self.read[rel_path] = entry
+        if entry[1] is None:
+            return None
+        return entry[1], entry[2]
+
+    def read_drain(self):
+        read = self.read
+        self.read = {}
+        return read
+
+    def __repr__(self):
+        return f"ImageSizes({self.root_dir}, {len(self.entries)} entries)"
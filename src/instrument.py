@@ -0,0 +1,150 @@
+
+import json
+import os
+import threading
+import time
+
+# spans are only recorded once enable() has been called, otherwise span() and
+# page() hand back a shared no-op context manager
+enabled = False
+events = []
+_page_stats = threading.local()
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def bytes_add(self, nbytes):
+        pass
+
+_null_span = _NullSpan()
+
+class _Span:
+    __slots__ = ("name", "nbytes", "start", "nested")
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+        self.nested = 0
+
+    def __enter__(self):
+        stack = getattr(_page_stats, "stack", None)
+        if stack is not None:
+            stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        stats = getattr(_page_stats, "stages", None)
+        if stats is None:
+            # outside of a page every span is its own trace event
+            events.append(_event(self.name, self.start, duration, { "bytes": self.nbytes }))
+            return False
+        # inside a page stages are exclusive, nested spans are not counted twice
+        stack = _page_stats.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested += duration
+        stage = stats.setdefault(self.name, [0, 0, 0])
+        stage[0] += duration - self.nested
+        stage[1] += self.nbytes
+        stage[2] += 1
+        return False
+
+    def bytes_add(self, nbytes):
+        self.nbytes += nbytes
+
+class _PageSpan:
+    __slots__ = ("src_path", "start")
+
+    def __init__(self, src_path):
+        self.src_path = src_path
+
+    def __enter__(self):
+        _page_stats.stages = {}
+        _page_stats.stack = []
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        stages = _page_stats.stages
+        _page_stats.stages = None
+        _page_stats.stack = None
+        # stage totals are laid out back to back inside the page span
+        offset = self.start
+        for name, (stage_duration, nbytes, calls) in stages.items():
+            events.append(_event(name, offset, stage_duration, { "bytes": nbytes, "calls": calls }))
+            offset += stage_duration
+        events.append(_event("page", self.start, duration, {
+            "src": self.src_path,
+            "stages": { name: { "ns": stage[0], "bytes": stage[1] } for name, stage in stages.items() },
+        }))
+        return False
+
+    def bytes_add(self, nbytes):
+        pass
+
+def _event(name, start_ns, duration_ns, args):
+    return {
+        "name": name,
+        "cat": name.split(".")[0],
+        "ph": "X",
+        "ts": start_ns / 1000,
+        "dur": duration_ns / 1000,
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+        "args": args,
+    }
+
+def enable():
+    global enabled
+    enabled = True
+
+def span(name, nbytes=0):
+    if not enabled:
+        return _null_span
+    return _Span(name, nbytes)
+
+def page(src_path):
+    if not enabled:
+        return _null_span
+    return _PageSpan(src_path)
+
+def events_drain():
+    drained = events[:]
+    del events[:len(drained)]
+    return drained
+
+def events_merge(other_events):
+    events.extend(other_events)
+
+def trace_write(path):
+    with open(path, "w") as trace_file:
+        json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, trace_file)
+
+def summary(limit=10):
+    pages = sorted(
+        (event for event in events if event["name"] == "page"),
+        key=lambda event: event["dur"],
+        reverse=True,
+    )
+    stage_names = sorted({ name for event in pages for name in event["args"]["stages"] })
+    header = ["page", "total ms"] + [f"{name} ms" for name in stage_names] + ["bytes in", "bytes out"]
+    rows = []
+    for event in pages[:limit]:
+        stages = event["args"]["stages"]
+        row = [event["args"]["src"], f"{event['dur'] / 1000:.2f}"]
+        row += [f"{stages[name]['ns'] / 1e6:.2f}" if name in stages else "-" for name in stage_names]
+        row.append(str(stages.get("md_block.scan", { "bytes": 0 })["bytes"]))
+        row.append(str(stages.get("page_gen.write", { "bytes": 0 })["bytes"]))
+        rows.append(row)
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    return "\n".join(lines)
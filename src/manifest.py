@@ -0,0 +1,46 @@
+
+import hashlib
+import json
+import os
+
+manifest_name = ".manifest.json"
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def hash_str(text):
+    return hash_bytes(text.encode("utf-8"))
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def manifest_load(dest_dir, section):
+    manifest_path = os.path.join(dest_dir, manifest_name)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as manifest_file:
+        try:
+            manifest = json.load(manifest_file)
+        except json.JSONDecodeError:
+            return {}
+    return manifest.get(section, {})
+
+def manifest_save(dest_dir, section, data):
+    manifest_path = os.path.join(dest_dir, manifest_name)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as manifest_file:
+            try:
+                manifest = json.load(manifest_file)
+            except json.JSONDecodeError:
+                manifest = {}
+    manifest[section] = data
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
@@ -1,4 +1,7 @@
 from enum import Enum
+import instrument
+import mmap
+import os
 import re
 
 class BlockType(Enum):
@@ -17,11 +20,13 @@ md_block_map = [
     { "type": BlockType.ORDERED_LIST, "pattern": r"^\d+\. .+", "tag": "ol", "sub_tag": "li" }
 ]
 
+_md_block_patterns = [(b["type"], re.compile(b["pattern"])) for b in md_block_map]
+
 def _md_block_type(block):
     deduce = (
-        b["type"]
-        for b in md_block_map
-        if re.match(b["pattern"], block)
+        type
+        for type, pattern in _md_block_patterns
+        if pattern.match(block)
     )
     return next(deduce, BlockType.PARAGRAPH)
 
@@ -34,6 +39,37 @@ def _md_block_tags(type):
     return next(deduce, ("p", None))
 
 def _md_inline_to_md_blocks(md):
-    md_blocks = md.split("\n\n")
-    md_blocks_stripped = list(map(str.strip, md_blocks))
-    return list(filter(lambda block: block != "", md_blocks_stripped))
\ No newline at end of file
+    return list(_md_lines_to_md_blocks(md.split("\n")))
+
+def _md_lines_to_md_blocks(lines):
+    # blocks are separated by empty lines, only the current block is held
+    block_lines = []
+    for line in lines:
+        if line.endswith("\n"):
+            line = line[:-2] if line.endswith("\r\n") else line[:-1]
+        if line != "":
+            block_lines.append(line)
+            continue
+        block = "\n".join(block_lines).strip()
+        block_lines = []
+        if block != "":
+            yield block
+    block = "\n".join(block_lines).strip()
+    if block != "":
+        yield block
+
+def md_file_to_md_blocks(path):
+    with open(path, "rb") as md_file:
+        if os.fstat(md_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(md_file.fileno(), 0, access=mmap.ACCESS_READ) as md_map:
+            lines = (line.decode("utf-8") for line in iter(md_map.readline, b""))
+            blocks = _md_lines_to_md_blocks(lines)
+            while True:
+                with instrument.span("md_block.scan") as scan_span:
+                    block = next(blocks, None)
+                    if block is None:
+                        break
+                    scan_span.bytes_add(len(block))
+                    type = _md_block_type(block)
+                yield block, type
\ No newline at end of file
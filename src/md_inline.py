@@ -1,16 +1,29 @@
+import instrument
 import re
 from html_node import LeafNode, ParentNode
 from md_block import BlockType, _md_block_tags, _md_block_type, _md_inline_to_md_blocks
 from md_node import MdNode, MdType
 
+# bump whenever the same markdown renders to different html, cached fragments
+# are keyed on it
+parser_version = 1
+
+# each pattern names its groups after the type value: "<type>_text" and, for
+# links and images, "<type>_url". nested types have their text re-tokenized.
 md_regex_map = [
-    { "type": MdType.BOLD, "symbol": "**", "pattern": r"\*\*(?:.*?)\*\*" },
-    { "type": MdType.ITALIC, "symbol": "_", "pattern": r"\_(?:.*?)\_" },
-    { "type": MdType.CODE, "symbol": "`", "pattern": r"\`(?:.*?)\`" },
-    { "type": MdType.LINK, "symbol": "", "pattern": r"(?<!!)\[(?:.*?)\]\((?:.*?)\)" },
-    { "type": MdType.IMAGE, "symbol": "!", "pattern": r"!\[(?:.*?)\]\((?:.*?)\)" } 
+    { "type": MdType.BOLD, "pattern": r"\*\*(?P<bold_text>.*?)\*\*", "tag": "b", "nested": True },
+    { "type": MdType.ITALIC, "pattern": r"_(?P<italic_text>.*?)_", "tag": "i", "nested": True },
+    { "type": MdType.CODE, "pattern": r"`(?P<code_text>.*?)`", "tag": "code", "nested": False },
+    { "type": MdType.LINK, "pattern": r"(?<!!)\[(?P<link_text>.*?)\]\((?P<link_url>.*?)\)", "tag": "a", "nested": True },
+    { "type": MdType.IMAGE, "pattern": r"!\[(?P<image_text>.*?)\]\((?P<image_url>.*?)\)", "tag": "img", "nested": False }
 ]
 
+md_inline_pattern = re.compile(
+    "|".join(f"(?P<{item['type'].value}>{item['pattern']})" for item in md_regex_map)
+)
+
+_md_regex_lookup = { item["type"].value: item for item in md_regex_map }
+
 def md_inline_to_html_node(md):
     html_nodes = []
     md_blocks = _md_inline_to_md_blocks(md)
@@ -19,33 +32,68 @@ def md_inline_to_html_node(md):
         html_nodes.append(parent_node)
     return ParentNode("div", html_nodes)
 
+def md_blocks_to_html_nodes(md_blocks, memo=None):
+    for block, type in md_blocks:
+        with instrument.span("md_inline.tokenize", len(block)):
+            if memo is not None:
+                html_node = memo.render(block, type)
+            else:
+                html_node = _md_block_to_html_parent_node(block, type)
+        yield html_node
+
 def _md_inline_to_md_nodes(md):
-    patterns = "|".join(f"({item['pattern']})" for item in md_regex_map)
-    md_split = re.split(patterns, md)
-    md_split = [t for t in md_split if t]
-    return list(map(_to_md_node, md_split))
+    md_nodes = []
+    start = 0
+    for match in md_inline_pattern.finditer(md):
+        if match.start() > start:
+            md_nodes.append(MdNode(md[start:match.start()], MdType.TEXT))
+        md_nodes.append(_md_match_to_md_node(match))
+        start = match.end()
+    if start < len(md):
+        md_nodes.append(MdNode(md[start:], MdType.TEXT))
+    return md_nodes
 
-def _to_md_node(md):
-    match_and_generate = (
-         _md_node_generate(md, md_regex["type"], md_regex["symbol"])
-        for md_regex in md_regex_map
-        if re.fullmatch(md_regex["pattern"], md)
-    )
-    return next(match_and_generate, MdNode(md, MdType.TEXT))
+def _md_match_to_md_node(match):
+    md_regex = _md_regex_lookup[match.lastgroup]
+    type = md_regex["type"]
+    text = match.group(f"{type.value}_text")
+    url = match.group(f"{type.value}_url") if type in (MdType.LINK, MdType.IMAGE) else None
+    children = None
+    if md_regex["nested"] and md_inline_pattern.search(text):
+        children = _md_inline_to_md_nodes(text)
+    return MdNode(text, type, url, children)
 
-def _md_node_generate(md, type, symbol):
+def _md_inline_to_html_nodes(md):
+    # same scan as _md_inline_to_md_nodes, building html nodes without the MdNode step
+    html_nodes = []
+    start = 0
+    for match in md_inline_pattern.finditer(md):
+        if match.start() > start:
+            html_nodes.append(LeafNode(None, md[start:match.start()]))
+        html_nodes.append(_md_match_to_html_node(match))
+        start = match.end()
+    if start < len(md):
+        html_nodes.append(LeafNode(None, md[start:]))
+    return html_nodes
+
+def _md_match_to_html_node(match):
+    md_regex = _md_regex_lookup[match.lastgroup]
+    type = md_regex["type"]
+    text = match.group(f"{type.value}_text")
     match type:
-        case MdType.BOLD | MdType.ITALIC | MdType.CODE:
-            md_stripped = md.strip(symbol)
-            return MdNode(md_stripped, type)
-        case MdType.LINK | MdType.IMAGE:
-            md_alt, md_url = md.lstrip(symbol + "[").rstrip(")]").split("](")
-            return MdNode(md_alt, type, md_url)
+        case MdType.LINK:
+            props = {"href": match.group("link_url")}
+        case MdType.IMAGE:
+            return LeafNode("img", "", {"src": match.group("image_url"), "alt": text})
         case _:
-            return MdNode(md, MdType.TEXT)
-        
-def _md_block_to_html_parent_node(block):
-    type = _md_block_type(block)
+            props = None
+    if md_regex["nested"] and md_inline_pattern.search(text):
+        return ParentNode(md_regex["tag"], _md_inline_to_html_nodes(text), props)
+    return LeafNode(md_regex["tag"], text, props)
+
+def _md_block_to_html_parent_node(block, type=None):
+    if type is None:
+        type = _md_block_type(block)
     tag, sub_tag = _md_block_tags(type)
     if type != BlockType.CODE:
         match type:
@@ -65,14 +113,15 @@ def _md_block_to_html_parent_node(block):
                 pattern = r"^\d+\.\s(.+)"
                 items = re.findall(pattern, block, flags=re.MULTILINE)
                 block = "".join(f"<li>{item}</li>" for item in items)
-        children = _md_inline_to_md_nodes(block)
-        children = list(map(_md_node_to_html_leaf_node, children))
+        children = _md_inline_to_html_nodes(block)
     else:
         block = block.strip("`")
         children = [LeafNode(sub_tag, block, None)]
     return ParentNode(tag, children)
 
 def _md_node_to_html_leaf_node(md_node):
+    if md_node.children is not None:
+        return _md_node_to_html_parent_node(md_node)
     match md_node.type:
         case MdType.TEXT:
             return LeafNode(None, md_node.text, None)
@@ -86,4 +135,15 @@ def _md_node_to_html_leaf_node(md_node):
             return LeafNode("a", md_node.text, {"href": md_node.url})
         case MdType.IMAGE:
             return LeafNode("img", "", {"src": md_node.url, "alt": md_node.text})
-        case _: raise ValueError("Invalid MdType: must not be None")
\ No newline at end of file
+        case _: raise ValueError("Invalid MdType: must not be None")
+
+def _md_node_to_html_parent_node(md_node):
+    children = list(map(_md_node_to_html_leaf_node, md_node.children))
+    match md_node.type:
+        case MdType.BOLD:
+            return ParentNode("b", children)
+        case MdType.ITALIC:
+            return ParentNode("i", children)
+        case MdType.LINK:
+            return ParentNode("a", children, {"href": md_node.url})
+        case _: raise ValueError(f"Invalid MdType: {md_node.type.value} can not have children")
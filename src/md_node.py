@@ -9,13 +9,23 @@ class MdType(Enum):
     IMAGE = "image"
 
 class MdNode:
-    def __init__(self, text, type, url = None):
+    __slots__ = ("text", "type", "url", "children")
+
+    def __init__(self, text, type, url = None, children = None):
         self.text = text
         self.type = type
         self.url = url
+        self.children = children
 
     def __eq__(self, other):
-        return self.text == other.text and self.type == other.type and self.url == other.url
+        return (
+            self.text == other.text
+            and self.type == other.type
+            and self.url == other.url
+            and self.children == other.children
+        )
 
     def __repr__(self):
-        return f"MdNode({self.text}, {self.type.value}, {self.url})"
\ No newline at end of file
+        if self.children is None:
+            return f"MdNode({self.text}, {self.type.value}, {self.url})"
+        return f"MdNode({self.text}, {self.type.value}, {self.url}, children: {self.children})"
\ No newline at end of file
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+from compress import directory_compress, sidecars_remove
+from manifest import hash_file, manifest_name
+from search_index import search_dir, search_docs_load, search_docs_name, search_docs_save, search_index_write
+from static_copy import assets_name, file_transfers
+
+def shards_merge(shard_dirs, dest_dir):
+    manifests = []
+    outputs = {}
+    search_docs = None
+    for shard_dir in shard_dirs:
+        manifest_path = os.path.join(shard_dir, manifest_name)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"Shard has no manifest: {shard_dir}")
+        with open(manifest_path, "r") as manifest_file:
+            manifests.append(json.load(manifest_file))
+        if os.path.exists(os.path.join(shard_dir, search_docs_name)):
+            search_docs = {} if search_docs is None else search_docs
+            _entries_merge("search", search_docs, search_docs_load(shard_dir))
+        for rel_path in _shard_files(shard_dir):
+            src_path = os.path.join(shard_dir, rel_path)
+            other = outputs.get(rel_path)
+            if other is None:
+                outputs[rel_path] = src_path
+            elif hash_file(other) != hash_file(src_path):
+                raise Exception(f"Shards disagree on {rel_path}: {other} and {src_path}")
+
+    merged = _manifests_merge(manifests)
+    previous = {}
+    previous_path = os.path.join(dest_dir, manifest_name)
+    if os.path.exists(previous_path):
+        with open(previous_path, "r") as manifest_file:
+            previous = json.load(manifest_file)
+
+    for rel_path, src_path in sorted(outputs.items()):
+        file_transfers["copy"](src_path, os.path.join(dest_dir, rel_path))
+    removed = 0
+    for rel_path in sorted(_manifest_outputs(previous) - set(outputs)):
+        dest_path = os.path.join(dest_dir, rel_path)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+            removed += 1
+
+    tmp_path = previous_path + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(merged, manifest_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, previous_path)
+    print(f"Merged {len(shard_dirs)} shard(s) into {dest_dir}: {len(outputs)} file(s), {removed} removed")
+
+    # the search index spans every page, it is only written once merged
+    if search_docs is not None:
+        search_docs_save(dest_dir, search_docs)
+        search_index_write(dest_dir, search_docs)
+    return merged
+
+def _shard_files(shard_dir, rel_dir=""):
+    files = []
+    for item in sorted(os.listdir(os.path.join(shard_dir, rel_dir))):
+        rel_path = os.path.join(rel_dir, item)
+        if rel_path in (manifest_name, search_docs_name):
+            continue
+        if os.path.isdir(os.path.join(shard_dir, rel_path)):
+            files.extend(_shard_files(shard_dir, rel_path))
+        else:
+            files.append(rel_path)
+    return files
+
+def _manifests_merge(manifests):
+    merged = {}
+    for manifest in manifests:
+        for section, data in manifest.items():
+            if section == "pages":
+                pages = merged.setdefault(section, { "inputs": data["inputs"], "entries": {} })
+                if pages["inputs"] != data["inputs"]:
+                    raise Exception("Shards were built with different templates, base paths or options")
+                _entries_merge(section, pages["entries"], data["entries"])
+            elif section == "images":
+                # a cache of image headers, any shard's reading will do
+                merged.setdefault(section, {}).update(data)
+            else:
+                _entries_merge(section, merged.setdefault(section, {}), data)
+    return merged
+
+def _entries_merge(section, entries, data):
+    for key, entry in data.items():
+        if key in entries and entries[key] != entry:
+            raise Exception(f"Shards disagree on {section} entry {key}")
+        entries[key] = entry
+
+def _manifest_outputs(manifest):
+    # every output file a build recorded, the search index cleans up after itself
+    outputs = set()
+    for entry in manifest.get("pages", {}).get("entries", {}).values():
+        outputs.add(entry["dest"])
+    for rel_path, entry in manifest.get("static", {}).items():
+        outputs.add(rel_path)
+        if "fingerprint" in entry:
+            outputs.add(entry["fingerprint"])
+    for rel_path in manifest.get("compress", {}):
+        outputs.add(rel_path + ".gz")
+    for dest_rels in manifest.get("listings", {}).values():
+        outputs.update(dest_rels)
+    outputs.add(assets_name)
+    return { rel_path for rel_path in outputs if not rel_path.startswith(search_dir + os.sep) }
+
+def args_parse():
+    parser = argparse.ArgumentParser(description="Merge the output directories of --shard builds into one site.")
+    parser.add_argument("dest_dir", help="output directory")
+    parser.add_argument("shard_dirs", nargs="+", help="output directories of the --shard builds")
+    parser.add_argument("--compress", action="store_true", help="write .gz sidecars for files written by the merge")
+    parser.add_argument("--compress-min-size", type=int, default=1024, help="smallest file in bytes that gets a .gz sidecar")
+    return parser.parse_args()
+
+def main():
+    args = args_parse()
+    shards_merge(args.shard_dirs, args.dest_dir)
+    if args.compress:
+        directory_compress(args.dest_dir, min_size=args.compress_min_size)
+    else:
+        sidecars_remove(args.dest_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+
+import re
+
+# whitespace is significant inside these elements and in css strings, both
+# are matched first and copied through untouched
+html_pattern = re.compile(
+    r"(?P<keep><(?P<tag>pre|textarea|script|style)\b[\s\S]*?</(?P=tag)>)"
+    r"|(?P<between>(?<=>)\s+(?=<))"
+    r"|(?P<space>\s{2,}|[\t\n\r\f\v])"
+)
+
+css_pattern = re.compile(
+    r"(?P<string>\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*')"
+    r"|(?P<comment>/\*[\s\S]*?\*/)"
+    r"|(?P<semicolon>;(?=\s*}))"
+    r"|(?P<space>\s+)"
+)
+
+css_tight_before = set("{};,>:(")
+css_tight_after = set("{};,>)")
+
+def html_minify(html):
+    return html_pattern.sub(_html_replace, html).strip()
+
+def _html_replace(match):
+    if match.group("keep") is not None:
+        return match.group("keep")
+    if match.group("between") is not None:
+        # indentation between tags goes, a space between inline elements stays
+        return "" if "\n" in match.group("between") else " "
+    return " "
+
+def css_minify(css):
+    return css_pattern.sub(_css_replace, css).strip()
+
+def _css_replace(match):
+    if match.group("string") is not None:
+        return match.group("string")
+    if match.group("comment") is not None or match.group("semicolon") is not None:
+        return ""
+    text = match.string
+    before = text[match.start() - 1] if match.start() > 0 else "{"
+    after = text[match.end()] if match.end() < len(text) else "}"
+    if before in css_tight_before or after in css_tight_after:
+        return ""
+    return " "
@@ -1,7 +1,27 @@
 
 import os
+import instrument
+import json
+import math
 import re
-from md_inline import md_inline_to_html_node
+from contextlib import redirect_stdout
+from io import StringIO
+from itertools import chain, islice
+from html_node import LeafNode, ParentNode
+from image_size import ImageSizes
+from manifest import hash_file, hash_str, manifest_load, manifest_save
+from md_block import md_file_to_md_blocks
+from md_inline import md_blocks_to_html_nodes
+from page_index import PageIndex, index_name
+from page_template import PageTemplate, preload_slot
+from shard import shard_select
+from search_index import search_docs_load, search_docs_save, search_index_write, search_dir, search_terms, search_weights, text_terms
+
+# generated listing pages of the posts under a content directory
+listing_section = "blog"
+listing_per_page = 10
+# blocks looked at for a page's first image before its head is written
+preload_lookahead = 8
 
 def md_title(md):
     match = re.search(r"^# (.+)", md)
@@ -10,37 +30,429 @@ def md_title(md):
     else:
         raise Exception("failed to find md title!")
 
-def page_generate(base_path, template_path, src_path, dest_path):
+def page_generate(base_path, template_path, src_path, dest_path, template=None, cache=None, src_hash=None, images=None, search=False, memo=None, index=False):
     print(f"Generating page from {src_path} to {dest_path} using {template_path}")
 
-    with open(template_path, "r") as template_file:
-        template = template_file.read()
+    if template is None:
+        template = PageTemplate.load(template_path, base_path)
+
+    with instrument.page(src_path):
+        dest_dir = os.path.dirname(dest_path)
+        with instrument.span("page_gen.makedirs"):
+            os.makedirs(dest_dir, exist_ok=True)
+
+        # stream into a temporary file so a failing page never leaves partial output
+        tmp_path = dest_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as dest_file:
+                page_meta = page_render(template, src_path, dest_file, cache, src_hash, images, search, memo, index)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, dest_path)
+    return page_meta
+
+def page_render(template, src_path, fp, cache=None, src_hash=None, images=None, search=False, memo=None, index=False):
+    cached = None
+    if cache is not None:
+        if src_hash is None:
+            src_hash = hash_file(src_path)
+        with instrument.span("page_gen.cache_load"):
+            cached = cache.get(src_hash)
+
+    if cached is not None:
+        title, html_nodes = cached
+    else:
+        with instrument.span("page_gen.read"):
+            with open(src_path, "r") as md_file:
+                title = md_title(md_file.readline())
+        html_nodes = md_blocks_to_html_nodes(md_file_to_md_blocks(src_path), memo)
+        if cache is not None:
+            html_nodes = cache.store(src_hash, title, html_nodes)
+    return page_write(template, title, html_nodes, fp, images, search, memo, index)
+
+def page_write(template, title, html_nodes, fp, images=None, search=False, memo=None, index=False):
+    # what pages_generate keeps about the page besides its output
+    page_meta = { "title": title }
+    if images is not None:
+        # sizes of the images the page uses, so a resized image re-renders it
+        page_meta["images"] = {}
+    if search:
+        page_meta["terms"] = {}
+        text_terms(title, page_meta["terms"], search_weights["title"])
+    if index:
+        page_meta.update({ "words": 0, "links": [], "image_urls": [] })
+    slots = { "Title": title }
+    if preload_slot in template.slots:
+        # the head is written before the content, only the first few blocks
+        # are looked at for an image worth preloading
+        html_nodes = iter(html_nodes)
+        head_nodes = list(islice(html_nodes, preload_lookahead))
+        html_nodes = chain(head_nodes, html_nodes)
+        src = _html_nodes_first_img(head_nodes)
+        slots[preload_slot] = f'<link rel="preload" href="{template.url_rewrite(src)}" as="image" />' if src else ""
+    slots["Content"] = _page_content_chunks(html_nodes, template.url_rewrite, images, page_meta)
+    # time not taken by the content stages is template assembly and writing
+    with instrument.span("page_gen.write") as write_span:
+        template.write(fp, slots)
+        if instrument.enabled:
+            write_span.bytes_add(fp.tell())
+    if images is not None:
+        page_meta["image_entries"] = images.read_drain()
+    if memo is not None:
+        memo.flush()
+        page_meta["memo"] = memo.stats_drain()
+    return page_meta
+
+def _page_content_chunks(html_nodes, url_rewrite, images=None, page_meta=None):
+    terms = page_meta.get("terms") if page_meta is not None else None
+    img_count = 0
+    yield "<div>"
+    for html_node in html_nodes:
+        if page_meta is not None and "words" in page_meta:
+            _html_node_meta(html_node, page_meta)
+        img_nodes = [] if images is not None else None
+        _html_node_urls_rewrite(html_node, url_rewrite, img_nodes)
+        if img_nodes:
+            with instrument.span("page_gen.images"):
+                for img_node, src in img_nodes:
+                    # the first image is likely above the fold, it stays eager
+                    _html_img_attrs(img_node, src, images, page_meta["images"], img_count == 0)
+                    img_count += 1
+        if terms is not None:
+            with instrument.span("page_gen.search"):
+                search_terms(html_node, terms)
+        with instrument.span("html_node.serialize"):
+            chunks = list(html_node.html_chunks())
+        yield from chunks
+    yield "</div>"
 
-    with open(src_path, "r") as md_file:
-        md = md_file.read()
+def _html_nodes_first_img(html_nodes):
+    for html_node in html_nodes:
+        if html_node.tag == "img" and html_node.props is not None and html_node.props.get("src"):
+            return html_node.props["src"]
+        if html_node.children is not None:
+            src = _html_nodes_first_img(html_node.children)
+            if src:
+                return src
+    return None
 
-    html_node = md_inline_to_html_node(md)
-    html = html_node.to_html()
-    title = md_title(md)
+def _html_node_urls_rewrite(html_node, rewrite, img_nodes=None):
+    if html_node.props is not None:
+        if img_nodes is not None and html_node.tag == "img" and "src" in html_node.props:
+            img_nodes.append((html_node, html_node.props["src"]))
+        for key in ("href", "src"):
+            if key in html_node.props:
+                html_node.props[key] = rewrite(html_node.props[key])
+    if html_node.children is not None:
+        for child in html_node.children:
+            _html_node_urls_rewrite(child, rewrite, img_nodes)
 
-    template = template.replace("{{ Title }}", title)
-    template = template.replace("{{ Content }}", html)
-    template = template.replace(f'href="/', f'href="{base_path}/')
-    template = template.replace(f'src="/', f'src="{base_path}/')
+def _html_node_meta(html_node, page_meta):
+    # runs before url rewriting, links and images are recorded as written
+    props = html_node.props
+    if props is not None:
+        if html_node.tag == "a" and "href" in props:
+            page_meta["links"].append(props["href"])
+        elif html_node.tag == "img" and "src" in props:
+            page_meta["image_urls"].append(props["src"])
+    if html_node.children is not None:
+        for child in html_node.children:
+            _html_node_meta(child, page_meta)
+    elif html_node.value:
+        page_meta["words"] += len(html_node.value.split())
 
-    dest_dir = os.path.dirname(dest_path)
-    os.makedirs(dest_dir, exist_ok=True)
+def _html_img_attrs(html_node, src, images, page_images, eager):
+    rel_path = images.rel_path(src)
+    size = images.size(rel_path) if rel_path is not None else None
+    if rel_path is not None:
+        page_images[rel_path] = list(size or (None, None))
+    if size is not None:
+        html_node.props["width"] = str(size[0])
+        html_node.props["height"] = str(size[1])
+    if not eager:
+        html_node.props["loading"] = "lazy"
+    html_node.props["decoding"] = "async"
 
-    with open(dest_path, "w") as dest_file:
-        dest_file.write(template)
-        
-def pages_generate(base_path, template_path, src_dir, dest_dir):
-    src_items = os.listdir(src_dir)
+def pages_collect(src_dir, dest_dir):
+    pages = []
+    src_items = sorted(os.listdir(src_dir))
     for item in src_items:
         src_path = os.path.join(src_dir, item)
         dest_path = os.path.join(dest_dir, item)
         if os.path.isfile(src_path):
             dest_path = dest_path.replace(".md", ".html")
-            page_generate(base_path, template_path, src_path, dest_path)
+            pages.append((src_path, dest_path))
+        else:
+            pages.extend(pages_collect(src_path, dest_path))
+    return pages
+
+def pages_generate(base_path, template_path, src_dir, dest_dir, jobs=1, only=None, cache=None, assets=None, minify=False, images=False, search=False, memo=None, shard=None, template=None, index=False, css_dir=None, css_inline_max=4096):
+    manifest = manifest_load(dest_dir, "pages")
+    if template is None:
+        with instrument.span("page_gen.template_load"):
+            template = PageTemplate.load(template_path, base_path, assets, minify, css_dir, css_inline_max)
+    inputs = {
+        "template": hash_file(template_path),
+        "base_path": hash_str(base_path),
+        "assets": hash_str(json.dumps(assets or {}, sort_keys=True)),
+        "minify": minify,
+        "images": images,
+        "search": search,
+    }
+    if css_dir is not None:
+        # inlined stylesheets are part of every page
+        inputs["css"] = hash_str("".join(template.parts))
+    rebuild_all = manifest.get("inputs") != inputs
+    entries = manifest.get("entries", {})
+
+    if only is None or rebuild_all:
+        pages = {}
+        sources = pages_collect(src_dir, dest_dir)
+    else:
+        # only look at the given sources, every other page stays as recorded
+        pages = { src_rel: entry for src_rel, entry in entries.items() if src_rel not in only }
+        sources = [
+            (os.path.join(src_dir, src_rel), os.path.join(dest_dir, src_rel).replace(".md", ".html"))
+            for src_rel in sorted(only)
+            if os.path.isfile(os.path.join(src_dir, src_rel))
+        ]
+    if shard is not None:
+        # keyed like the static split, however src_dir is spelled on each machine
+        selected = shard_select({ os.path.relpath(src_path, src_dir): os.path.getsize(src_path) for src_path, _ in sources }, shard)
+        sources = [(src_path, dest_path) for src_path, dest_path in sources if os.path.relpath(src_path, src_dir) in selected]
+
+    # images is the static directory image urls resolve in, read there rather
+    # than in the output so a shard sizes images another shard copies
+    image_sizes = ImageSizes(images, manifest_load(dest_dir, "images")) if images else None
+    search_docs = search_docs_load(dest_dir) if search else None
+    page_index = PageIndex(os.path.join(dest_dir, index_name)) if index else None
+    indexed = page_index.sources() if page_index is not None else None
+
+    pending = []
+    for src_path, dest_path in sources:
+        src_rel = os.path.relpath(src_path, src_dir)
+        dest_rel = os.path.relpath(dest_path, dest_dir)
+        with instrument.span("page_gen.hash"):
+            src_hash = hash_file(src_path)
+        pages[src_rel] = { "hash": src_hash, "dest": dest_rel }
+        entry = entries.get(src_rel)
+        if (
+            rebuild_all
+            or entry is None
+            or (entry["hash"], entry["dest"]) != (src_hash, dest_rel)
+            or not os.path.exists(dest_path)
+            or (image_sizes is not None and _page_images_changed(entry, image_sizes))
+            or (search_docs is not None and search_docs.get(src_rel, {}).get("hash") != src_hash)
+            or (indexed is not None and indexed.get(src_rel.replace(os.sep, "/")) != src_hash)
+        ):
+            pending.append((src_rel, src_path, dest_path, src_hash))
+        elif "images" in entry:
+            pages[src_rel]["images"] = entry["images"]
+
+    failures, rendered = _pages_render(base_path, template_path, template, pending, jobs, cache, image_sizes, search, memo, index)
+    for src_rel, page_meta in rendered.items():
+        if "memo" in page_meta:
+            memo.stats_merge(page_meta["memo"])
+        if "images" in page_meta:
+            pages[src_rel]["images"] = page_meta["images"]
+            image_sizes.entries.update(page_meta["image_entries"])
+        if "terms" in page_meta:
+            url = template.url_rewrite("/" + _page_url(pages[src_rel]["dest"]))
+            search_docs[src_rel] = {
+                "hash": pages[src_rel]["hash"], "url": url, "title": page_meta["title"], "terms": page_meta["terms"],
+            }
+        if "words" in page_meta:
+            dest_rel = pages[src_rel]["dest"]
+            page_index.update(
+                src_rel.replace(os.sep, "/"), dest_rel.replace(os.sep, "/"), "/" + _page_url(dest_rel),
+                pages[src_rel]["hash"], page_meta,
+            )
+    if minify:
+        rendered_count = len(pending) - len(failures)
+        print(f"Minified template: {template.saved_bytes * rendered_count} bytes saved over {rendered_count} page(s)")
+    for src_rel in failures:
+        del pages[src_rel]
+
+    for src_rel, entry in entries.items():
+        if src_rel in pages or src_rel in failures:
+            continue
+        _page_remove(dest_dir, entry["dest"])
+
+    if page_index is not None:
+        sources = { src_rel.replace(os.sep, "/") for src_rel in pages }
+        for src in indexed.keys() - sources:
+            page_index.remove(src)
+        page_index.commit()
+        taken = { entry["dest"].replace(os.sep, "/") for entry in pages.values() }
+        listings = _listings_write(template, page_index, dest_dir, manifest_load(dest_dir, "listings"), taken)
+        page_index.close()
+        manifest_save(dest_dir, "listings", listings)
+    else:
+        previous = manifest_load(dest_dir, "listings")
+        for dest_rels in previous.values():
+            for dest_rel in dest_rels:
+                _page_remove(dest_dir, dest_rel)
+        if previous:
+            manifest_save(dest_dir, "listings", {})
+
+    manifest_save(dest_dir, "pages", { "inputs": inputs, "entries": pages })
+    if image_sizes is not None:
+        manifest_save(dest_dir, "images", image_sizes.entries)
+    if search_docs is not None:
+        kept = { src_rel: doc for src_rel, doc in search_docs.items() if src_rel in pages }
+        # a build that rendered and removed nothing leaves the terms and index as they are
+        if rendered or len(kept) != len(search_docs) or not os.path.exists(os.path.join(dest_dir, search_dir)):
+            search_docs_save(dest_dir, kept)
+            # a shard only knows its own pages, the merge writes the index
+            if shard is None:
+                search_index_write(dest_dir, kept)
+    if cache is not None:
+        cache.evict()
+    if memo is not None:
+        memo.evict()
+        stats = memo.stats_drain()
+        print(f"Block memo: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['evictions']} evicted")
+
+    if failures:
+        raise Exception(f"failed to generate {len(failures)} page(s): {', '.join(sorted(failures))}")
+
+def _listings_write(template, page_index, dest_dir, previous, taken):
+    # listing pages come from indexed rows, no post is read to build them
+    section = listing_section
+    count = page_index.section_count(section)
+    total = math.ceil(count / listing_per_page)
+    listing_rels = [
+        f"{section}/index.html" if number == 1 and f"{section}/index.html" not in taken
+        else f"{section}/page/{number}/index.html"
+        for number in range(1, total + 1)
+    ]
+    written = 0
+    for number, dest_rel in enumerate(listing_rels, start=1):
+        rows = page_index.section_pages(section, listing_per_page, (number - 1) * listing_per_page)
+        title = section.capitalize() if number == 1 else f"{section.capitalize()}, page {number}"
+        html_nodes = _listing_nodes(title, rows, listing_rels, number)
+        page = StringIO()
+        page_write(template, title, html_nodes, page)
+        if _listing_write(os.path.join(dest_dir, dest_rel), page.getvalue()):
+            written += 1
+    for dest_rel in previous.get(section, []):
+        if dest_rel not in listing_rels:
+            _page_remove(dest_dir, dest_rel)
+    if count:
+        print(f"Listed {count} {section} page(s) on {total} listing page(s), {written} written")
+    return { section: listing_rels }
+
+def _listing_nodes(title, rows, listing_rels, number):
+    items = [
+        ParentNode("li", [LeafNode("a", page_title, { "href": url }), LeafNode(None, f" ({words} words)")])
+        for url, page_title, words in rows
+    ]
+    html_nodes = [LeafNode("h1", title), ParentNode("ul", items)]
+    links = []
+    if number > 1:
+        links.append(LeafNode("a", "< Previous", { "href": "/" + _page_url(listing_rels[number - 2]) }))
+    if number < len(listing_rels):
+        if links:
+            links.append(LeafNode(None, " "))
+        links.append(LeafNode("a", "Next >", { "href": "/" + _page_url(listing_rels[number]) }))
+    if links:
+        html_nodes.append(ParentNode("p", links))
+    return html_nodes
+
+def _listing_write(dest_path, html):
+    try:
+        with open(dest_path, "r") as dest_file:
+            if dest_file.read() == html:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = dest_path + ".tmp"
+    with open(tmp_path, "w") as dest_file:
+        dest_file.write(html)
+    os.replace(tmp_path, dest_path)
+    return True
+
+def _page_url(dest_rel):
+    # pages are linked by directory, without the index.html
+    url = dest_rel.replace(os.sep, "/")
+    if url == "index.html" or url.endswith("/index.html"):
+        return url[:-len("index.html")]
+    return url
+
+def _page_images_changed(entry, image_sizes):
+    for rel_path, size in entry.get("images", {}).items():
+        if list(image_sizes.size(rel_path) or (None, None)) != size:
+            return True
+    return False
+
+def _pages_render(base_path, template_path, template, pending, jobs, cache, images=None, search=False, memo=None, index=False):
+    failures = {}
+    rendered = {}
+    if jobs <= 1 or len(pending) <= 1:
+        for src_rel, src_path, dest_path, src_hash in pending:
+            log, error, _, page_meta = _page_render(
+                base_path, template_path, template, src_path, dest_path, cache, src_hash, images, search, memo, index,
+            )
+            print(log, end="")
+            if error is not None:
+                failures[src_rel] = error
+            else:
+                rendered[src_rel] = page_meta
+        return failures, rendered
+
+    # the pool is only imported when it is used, single pages start faster
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # hand out the largest pages first so a long page doesn't finish last
+    pending = sorted(pending, key=lambda page: os.path.getsize(page[1]), reverse=True)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                _page_render, base_path, template_path, template, src_path, dest_path, cache, src_hash, images, search, memo, index,
+                True, instrument.enabled,
+            ): src_rel
+            for src_rel, src_path, dest_path, src_hash in pending
+        }
+        for future in as_completed(futures):
+            log, error, events, page_meta = future.result()
+            instrument.events_merge(events)
+            print(log, end="")
+            if error is not None:
+                failures[futures[future]] = error
+            else:
+                rendered[futures[future]] = page_meta
+    return failures, rendered
+
+def _page_render(base_path, template_path, template, src_path, dest_path, cache, src_hash, images=None, search=False, memo=None, index=False, capture=False, profile=False):
+    # workers hand their output and trace events back so each page's log stays in one piece
+    if profile:
+        instrument.enable()
+    log = StringIO()
+    error = None
+    page_meta = None
+    try:
+        if capture:
+            with redirect_stdout(log):
+                page_meta = page_generate(base_path, template_path, src_path, dest_path, template, cache, src_hash, images, search, memo, index)
         else:
-            pages_generate(base_path, template_path, src_path, dest_path)
\ No newline at end of file
+            page_meta = page_generate(base_path, template_path, src_path, dest_path, template, cache, src_hash, images, search, memo, index)
+    except Exception as e:
+        log.write(f"Failed to generate page from {src_path}: {e}\n")
+        error = str(e)
+    events = instrument.events_drain() if capture else []
+    return log.getvalue(), error, events, page_meta
+
+def _page_remove(dest_dir, dest_rel):
+    dest_path = os.path.join(dest_dir, dest_rel)
+    if os.path.exists(dest_path):
+        print(f"Removing stale page {dest_path}")
+        os.remove(dest_path)
+    parent_dir = os.path.dirname(dest_path)
+    while parent_dir != os.path.normpath(dest_dir):
+        try:
+            os.rmdir(parent_dir)
+        except OSError:
+            break
+        parent_dir = os.path.dirname(parent_dir)
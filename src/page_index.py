@@ -0,0 +1,70 @@
+
+import os
+import sqlite3
+
+index_name = ".pages.sqlite"
+
+schema = """
+CREATE TABLE IF NOT EXISTS pages (
+    src TEXT PRIMARY KEY,
+    dest TEXT NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    words INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS links (src TEXT NOT NULL, url TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS images (src TEXT NOT NULL, url TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS links_src ON links (src);
+CREATE INDEX IF NOT EXISTS links_url ON links (url);
+CREATE INDEX IF NOT EXISTS images_src ON images (src);
+"""
+
+class PageIndex:
+    # metadata of every generated page, rows only change with their page.
+    # sources are stored with "/" separators, urls root-relative without the
+    # base path.
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(schema)
+
+    def sources(self):
+        # source hash of every row, a page edited while the index was off is stale
+        return dict(self.connection.execute("SELECT src, hash FROM pages"))
+
+    def update(self, src, dest, url, src_hash, page_meta):
+        self.remove(src)
+        self.connection.execute(
+            "INSERT INTO pages (src, dest, url, title, hash, words) VALUES (?, ?, ?, ?, ?, ?)",
+            (src, dest, url, page_meta["title"], src_hash, page_meta["words"]),
+        )
+        self.connection.executemany("INSERT INTO links (src, url) VALUES (?, ?)", [(src, url) for url in page_meta["links"]])
+        self.connection.executemany("INSERT INTO images (src, url) VALUES (?, ?)", [(src, url) for url in page_meta["image_urls"]])
+
+    def remove(self, src):
+        for table in ("pages", "links", "images"):
+            self.connection.execute(f"DELETE FROM {table} WHERE src = ?", (src,))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def section_count(self, section):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM pages WHERE src GLOB ? AND src != ?",
+            (f"{section}/*", f"{section}/index.md"),
+        ).fetchone()[0]
+
+    def section_pages(self, section, limit, offset=0):
+        # (url, title, words) of the pages under section, its own index excluded
+        return self.connection.execute(
+            "SELECT url, title, words FROM pages WHERE src GLOB ? AND src != ? ORDER BY src LIMIT ? OFFSET ?",
+            (f"{section}/*", f"{section}/index.md", limit, offset),
+        ).fetchall()
+
+    def __repr__(self):
+        return f"PageIndex({self.path})"
@@ -0,0 +1,112 @@
+import os
+import posixpath
+import re
+from minify import css_minify, html_minify
+
+slot_pattern = re.compile(r"\{\{ (\w+) \}\}")
+url_pattern = re.compile(r'(href|src)="(/[^"]*)"')
+head_pattern = re.compile(r"<head\b[^>]*>")
+link_pattern = re.compile(r"<link\b[^>]*>")
+attr_pattern = re.compile(r'([\w-]+)="([^"]*)"')
+css_url_pattern = re.compile(r"""url\(\s*(['"]?)(?!data:|[a-z]+:|//|#)([^'")]+)\1\s*\)""")
+# filled per page with a preload hint for its first image
+preload_slot = "Preload"
+
+class PageTemplate:
+    def __init__(self, template, base_path="", assets=None, minify=False, css_dir=None, css_inline_max=4096):
+        self.base_path = base_path
+        self.assets = assets or {}
+        self.css_sources = {}
+        # minified once here, every page then reuses the collapsed literals
+        self.saved_bytes = 0
+        if minify:
+            minified = html_minify(template)
+            self.saved_bytes = len(template.encode("utf-8")) - len(minified.encode("utf-8"))
+            template = minified
+        if css_dir is not None:
+            # stylesheets are read once here, pages are rendered from the result
+            template = self._stylesheets_inline(template, css_dir, css_inline_max, minify)
+            template = template.replace("</head>", f"{{{{ {preload_slot} }}}}</head>", 1)
+        template = url_pattern.sub(
+            lambda match: f'{match.group(1)}="{self.url_rewrite(match.group(2))}"',
+            template,
+        )
+        # literal text at even indices, slot names at odd indices
+        self.parts = []
+        self.slots = {}
+        start = 0
+        for match in slot_pattern.finditer(template):
+            self.parts.append(template[start:match.start()])
+            self.parts.append(match.group(1))
+            self.slots[match.group(1)] = match.group(0)
+            start = match.end()
+        self.parts.append(template[start:])
+
+    def _stylesheets_inline(self, template, css_dir, css_inline_max, minify):
+        preloads = []
+
+        def link_inline(match):
+            attrs = dict(attr_pattern.findall(match.group(0)))
+            href = attrs.get("href", "")
+            if attrs.get("rel") != "stylesheet" or not href.startswith("/") or href.startswith("//"):
+                return match.group(0)
+            css_path = os.path.join(css_dir, href.lstrip("/"))
+            try:
+                css_stat = os.stat(css_path)
+            except OSError:
+                return match.group(0)
+            # what the compiled template was built from, see Site.template
+            self.css_sources[css_path] = css_stat.st_mtime_ns
+            if css_stat.st_size > css_inline_max:
+                preloads.append(f'<link rel="preload" href="{href}" as="style" />')
+                return match.group(0)
+            with open(css_path, "r") as css_file:
+                css = css_file.read()
+            if minify:
+                css = css_minify(css)
+            # relative urls were relative to the stylesheet, not to each page
+            css_base = posixpath.dirname(href)
+            css = css_url_pattern.sub(
+                lambda url: f"url({url.group(1)}{self.url_rewrite(posixpath.normpath(posixpath.join(css_base, url.group(2))))}{url.group(1)})",
+                css,
+            )
+            return f"<style>{css}</style>"
+
+        template = link_pattern.sub(link_inline, template)
+        if preloads:
+            head = head_pattern.search(template)
+            if head is not None:
+                template = template[:head.end()] + "".join(preloads) + template[head.end():]
+        return template
+
+    @classmethod
+    def load(cls, template_path, base_path="", assets=None, minify=False, css_dir=None, css_inline_max=4096):
+        with open(template_path, "r") as template_file:
+            return cls(template_file.read(), base_path, assets, minify, css_dir, css_inline_max)
+
+    def url_rewrite(self, url):
+        # root-relative urls get their fingerprinted name and the base path
+        if url.startswith("/"):
+            return self.base_path + self.assets.get(url, url)
+        return url
+
+    def render(self, slots):
+        return "".join(self.chunks(slots))
+
+    def write(self, fp, slots):
+        # slot values may be strings or iterables of string chunks
+        for chunk in self.chunks(slots):
+            if isinstance(chunk, str):
+                fp.write(chunk)
+            else:
+                fp.writelines(chunk)
+
+    def chunks(self, slots):
+        for i, part in enumerate(self.parts):
+            if i % 2 == 0:
+                yield part
+            else:
+                yield slots.get(part, self.slots[part])
+
+    def __repr__(self):
+        return f"PageTemplate({self.base_path}, slots: {list(self.slots)})"
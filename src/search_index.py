@@ -0,0 +1,107 @@
+
+import instrument
+import json
+import os
+import re
+
+search_dir = "search"
+# every page's terms, kept out of the shared manifest that each build
+# reads and rewrites several times
+search_docs_name = ".search.json"
+term_pattern = re.compile(r"\w{2,}")
+# a term's weight on a page is the sum over its occurrences
+search_weights = {
+    "title": 8,
+    "heading": 4,
+    "body": 1,
+}
+heading_tags = { "h1", "h2", "h3", "h4", "h5", "h6" }
+
+def search_terms(html_node, terms, weight=search_weights["body"]):
+    # code blocks are left out, their identifiers make poor search terms
+    if html_node.tag == "pre":
+        return
+    if html_node.tag in heading_tags:
+        weight = search_weights["heading"]
+    if html_node.children is not None:
+        for child in html_node.children:
+            search_terms(child, terms, weight)
+    elif html_node.value:
+        text_terms(html_node.value, terms, weight)
+
+def text_terms(text, terms, weight):
+    for term in term_pattern.findall(text.lower()):
+        terms[term] = terms.get(term, 0) + weight
+
+def search_shard_name(term, prefix_len=2):
+    # anything but [a-z0-9] is spelled as its code point to keep file names portable
+    return "".join(
+        char if char.isascii() and char.isalnum() else f"_{ord(char):x}"
+        for char in term[:prefix_len]
+    )
+
+def search_docs_load(dest_dir):
+    try:
+        with open(os.path.join(dest_dir, search_docs_name), "r", encoding="utf-8") as docs_file:
+            return json.load(docs_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def search_docs_save(dest_dir, docs):
+    os.makedirs(dest_dir, exist_ok=True)
+    docs_path = os.path.join(dest_dir, search_docs_name)
+    tmp_path = docs_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as docs_file:
+        json.dump(docs, docs_file, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, docs_path)
+
+def search_index_write(dest_dir, docs, prefix_len=2):
+    # docs maps a source to its url, title and term weights, ids follow its sorted order
+    with instrument.span("search_index.build"):
+        doc_list = []
+        shards = {}
+        for doc_id, src_rel in enumerate(sorted(docs)):
+            doc = docs[src_rel]
+            doc_list.append([doc["url"], doc["title"]])
+            for term, weight in doc["terms"].items():
+                shard = shards.setdefault(search_shard_name(term, prefix_len), {})
+                shard.setdefault(term, []).append([doc_id, weight])
+        for shard in shards.values():
+            for postings in shard.values():
+                postings.sort(key=lambda posting: (-posting[1], posting[0]))
+
+    index_dir = os.path.join(dest_dir, search_dir)
+    os.makedirs(index_dir, exist_ok=True)
+    files = { "index.json": { "prefix": prefix_len, "docs": doc_list } }
+    for name, shard in shards.items():
+        files[name + ".json"] = shard
+
+    written = 0
+    with instrument.span("search_index.write"):
+        for name, data in files.items():
+            if _index_file_write(os.path.join(index_dir, name), data):
+                written += 1
+        removed = 0
+        # only stale shards, .gz sidecars belong to directory_compress
+        for name in os.listdir(index_dir):
+            if name.endswith(".json") and name not in files:
+                os.remove(os.path.join(index_dir, name))
+                removed += 1
+    print(
+        f"Indexed {len(doc_list)} page(s) into {len(shards)} search shard(s): "
+        f"{written} written, {removed} removed"
+    )
+
+def _index_file_write(path, data):
+    text = json.dumps(data, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+    try:
+        with open(path, "r", encoding="utf-8") as index_file:
+            if index_file.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as index_file:
+        index_file.write(text)
+    os.replace(tmp_path, path)
+    return True
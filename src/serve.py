@@ -0,0 +1,166 @@
+
+import argparse
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import unquote, urlsplit
+from page_gen import page_render
+from page_template import PageTemplate
+
+static_dir = "static/"
+src_dir = "content/"
+template_path = "template.html"
+
+class RenderCache:
+    def __init__(self, template_path, base_path="", max_pages=256):
+        self.template_path = template_path
+        self.base_path = base_path
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+        self.template = None
+        self.template_mtime = None
+        self.lock = threading.Lock()
+
+    def _template_load(self):
+        mtime = os.stat(self.template_path).st_mtime_ns
+        if mtime != self.template_mtime:
+            self.template = PageTemplate.load(self.template_path, self.base_path)
+            self.template_mtime = mtime
+            self.pages.clear()
+        return self.template
+
+    def page(self, src_path):
+        mtime = os.stat(src_path).st_mtime_ns
+        with self.lock:
+            template = self._template_load()
+            cached = self.pages.get(src_path)
+            if cached is not None and cached[0] == mtime:
+                self.pages.move_to_end(src_path)
+                return cached[1]
+
+        page = StringIO()
+        page_render(template, src_path, page)
+        html = page.getvalue().encode("utf-8")
+
+        with self.lock:
+            if template is self.template:
+                self.pages[src_path] = (mtime, html)
+                self.pages.move_to_end(src_path)
+                while len(self.pages) > self.max_pages:
+                    self.pages.popitem(last=False)
+        return html
+
+    def __repr__(self):
+        return f"RenderCache({self.template_path}, {len(self.pages)}/{self.max_pages} pages)"
+
+def page_path_resolve(src_dir, url_path):
+    rel = os.path.normpath(url_path.strip("/"))
+    if rel.startswith(os.pardir) or os.path.isabs(rel):
+        return None
+    if rel == ".":
+        rel = ""
+    if rel.endswith(".html"):
+        rel = rel[:-len(".html")]
+    candidates = [os.path.join(src_dir, rel, "index.md"), os.path.join(src_dir, rel + ".md")]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def base_path_strip(base_path, url_path):
+    # rendered urls carry the base path, anything outside of it is not the site's
+    base_path = base_path.rstrip("/")
+    if not base_path:
+        return url_path
+    if url_path == base_path:
+        return "/"
+    if not url_path.startswith(base_path + "/"):
+        return None
+    return url_path[len(base_path):]
+
+def static_path_resolve(static_dir, url_path):
+    rel = os.path.normpath(url_path.lstrip("/"))
+    if rel.startswith(os.pardir) or os.path.isabs(rel) or rel == ".":
+        return None
+    path = os.path.join(static_dir, rel)
+    if os.path.isfile(path):
+        return path
+    return None
+
+class DevRequestHandler(SimpleHTTPRequestHandler):
+    render_cache = None
+
+    def do_GET(self):
+        self._respond(include_body=True)
+
+    def do_HEAD(self):
+        self._respond(include_body=False)
+
+    def _respond(self, include_body):
+        url_path = base_path_strip(self.render_cache.base_path, unquote(urlsplit(self.path).path))
+        if url_path is None:
+            return self.send_error(404, "Page not found")
+
+        static_path = static_path_resolve(static_dir, url_path)
+        if static_path is not None:
+            return self._send_static(static_path, include_body)
+
+        src_path = page_path_resolve(src_dir, url_path)
+        if src_path is None:
+            return self.send_error(404, "Page not found")
+        try:
+            html = self.render_cache.page(src_path)
+        except Exception as e:
+            return self.send_error(500, f"Failed to render {src_path}: {e}")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if include_body:
+            self.wfile.write(html)
+
+    def _send_static(self, static_path, include_body):
+        stat = os.stat(static_path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        content_type = mimetypes.guess_type(static_path)[0] or "application/octet-stream"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if include_body:
+            with open(static_path, "rb") as static_file:
+                self.copyfile(static_file, self.wfile)
+
+def args_parse():
+    parser = argparse.ArgumentParser(description="Serve the site, rendering pages on request.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8888, help="port to listen on")
+    parser.add_argument("--base-path", default="", help="prefix for root-relative href/src urls")
+    parser.add_argument("--cache-size", type=int, default=256, help="number of rendered pages to keep")
+    return parser.parse_args()
+
+def main():
+    args = args_parse()
+    DevRequestHandler.render_cache = RenderCache(template_path, args.base_path, args.cache_size)
+    server = ThreadingHTTPServer((args.host, args.port), DevRequestHandler)
+    print(f"Serving {src_dir} and {static_dir} on http://{args.host}:{args.port}{args.base_path.rstrip('/')}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import argparse
+from manifest import hash_str
+
+def shard_parse(text):
+    # "I/N" on the command line, 1-based, kept as a 0-based index
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {text!r}")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {text!r} is out of range")
+    return index - 1, count
+
+def shard_select(sizes, shard):
+    # every machine sees the same sizes, so the same split: largest files first,
+    # ties broken by path hash, each onto the least loaded shard
+    index, count = shard
+    loads = [0] * count
+    selected = set()
+    for rel_path, size in sorted(sizes.items(), key=lambda item: (-item[1], hash_str(item[0]))):
+        target = loads.index(min(loads))
+        loads[target] += size
+        if target == index:
+            selected.add(rel_path)
+    return selected
@@ -0,0 +1,145 @@
+
+import os
+from collections import OrderedDict
+
+# the generator modules are imported on first use, a process embedding Site
+# only pays for what it calls
+
+class Site:
+    # a long-lived handle on one site: the compiled template, the parsed-page
+    # caches and rendered strings stay warm between calls
+    def __init__(
+        self, base_path="", dest_dir="docs/", src_dir="content/", static_dir="static/",
+        template_path="template.html", jobs=1, fingerprint=False, minify=False, image_attrs=False,
+        search=False, blog_index=False, inline_css=False, css_inline_max=4096, compress=False, compress_min_size=1024,
+        cache_dir=".cache/fragments", memo_path=None, max_strings=256,
+    ):
+        self.base_path = base_path
+        self.dest_dir = dest_dir
+        self.src_dir = src_dir
+        self.static_dir = static_dir
+        self.template_path = template_path
+        self.jobs = jobs
+        self.fingerprint = fingerprint
+        self.minify = minify
+        self.image_attrs = image_attrs
+        self.search = search
+        self.blog_index = blog_index
+        self.inline_css = inline_css
+        self.css_inline_max = css_inline_max
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self.cache_dir = cache_dir
+        self.memo_path = memo_path
+        self.max_strings = max_strings
+        self.assets = None
+        self._cache = None
+        self._memo = None
+        self._template = None
+        self._template_key = None
+        self._strings = OrderedDict()
+
+    def cache(self):
+        if self._cache is None and self.cache_dir is not None:
+            from fragment_cache import FragmentCache
+            self._cache = FragmentCache(self.cache_dir)
+        return self._cache
+
+    def memo(self):
+        if self._memo is None and self.memo_path is not None:
+            from block_memo import BlockMemo
+            self._memo = BlockMemo(self.memo_path)
+        return self._memo
+
+    def template(self):
+        # recompiled only when the file, an inlined stylesheet or the
+        # fingerprinted names changed
+        from page_template import PageTemplate
+        assets = self._assets()
+        key = (os.stat(self.template_path).st_mtime_ns, sorted(assets.items()), self._css_mtimes())
+        if key != self._template_key:
+            self._template = PageTemplate.load(
+                self.template_path, self.base_path, assets, self.minify,
+                self.static_dir if self.inline_css else None, self.css_inline_max,
+            )
+            key = (key[0], key[1], self._css_mtimes())
+            self._template_key = key
+            self._strings.clear()
+        return self._template
+
+    def _css_mtimes(self):
+        if self._template is None:
+            return None
+        css_mtimes = []
+        for css_path in sorted(self._template.css_sources):
+            try:
+                css_mtimes.append(os.stat(css_path).st_mtime_ns)
+            except OSError:
+                css_mtimes.append(None)
+        return css_mtimes
+
+    def _assets(self):
+        if self.assets is None:
+            from static_copy import assets_load
+            self.assets = assets_load(self.dest_dir)
+        return self.assets
+
+    def render_string(self, md):
+        # a complete page for markdown that isn't a file, e.g. a preview
+        from io import StringIO
+        from manifest import hash_str
+        from md_block import _md_inline_to_md_blocks
+        from md_inline import md_blocks_to_html_nodes
+        from page_gen import md_title, page_write
+        template = self.template()
+        key = hash_str(md)
+        html = self._strings.get(key)
+        if html is not None:
+            self._strings.move_to_end(key)
+            return html
+        title = md_title(md.split("\n", 1)[0])
+        html_nodes = md_blocks_to_html_nodes(((block, None) for block in _md_inline_to_md_blocks(md)), self.memo())
+        page = StringIO()
+        page_write(template, title, html_nodes, page, memo=self.memo())
+        html = page.getvalue()
+        self._strings[key] = html
+        while len(self._strings) > self.max_strings:
+            self._strings.popitem(last=False)
+        return html
+
+    def build_page(self, path):
+        # path is a markdown source, absolute or relative to src_dir
+        src_path = path if os.path.isabs(path) or os.path.exists(path) else os.path.join(self.src_dir, path)
+        src_rel = os.path.relpath(src_path, self.src_dir)
+        if src_rel.startswith(os.pardir):
+            raise ValueError(f"Page is outside of {self.src_dir}: {path}")
+        if not os.path.isfile(src_path):
+            raise FileNotFoundError(f"Page does not exist: {src_path}")
+        self._pages_generate({ src_rel })
+        return os.path.join(self.dest_dir, src_rel).replace(".md", ".html")
+
+    def build_all(self):
+        from static_copy import directory_sync
+        self.assets = directory_sync(
+            self.static_dir, self.dest_dir, fingerprint=self.fingerprint, minify=self.minify,
+        )
+        self._pages_generate(None)
+
+    def _pages_generate(self, only):
+        from page_gen import pages_generate
+        pages_generate(
+            self.base_path, self.template_path, self.src_dir, self.dest_dir,
+            jobs=self.jobs, only=only, cache=self.cache(), assets=self._assets(), minify=self.minify,
+            images=self.static_dir if self.image_attrs else None, search=self.search,
+            memo=self.memo(), template=self.template(), index=self.blog_index,
+            css_dir=self.static_dir if self.inline_css else None, css_inline_max=self.css_inline_max,
+        )
+        if self.compress:
+            from compress import directory_compress
+            directory_compress(self.dest_dir, min_size=self.compress_min_size)
+        else:
+            from compress import sidecars_remove
+            sidecars_remove(self.dest_dir)
+
+    def __repr__(self):
+        return f"Site({self.src_dir} -> {self.dest_dir}, {len(self._strings)} rendered strings)"
@@ -1,23 +1,245 @@
 
+import instrument
+import json
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from manifest import hash_file, hash_str, manifest_load, manifest_save
+from minify import css_minify
+from shard import shard_select
 
-def directory_clear(dir):
-    if os.path.exists(dir):
-        shutil.rmtree(dir)
-    os.mkdir(dir)
+assets_name = "assets.json"
 
-def directory_copy(src_dir, dest_dir):
+# static files rewritten while they are copied out when minify is on
+file_minifiers = {
+    ".css": css_minify,
+}
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# linux ioctl asking the filesystem for a copy-on-write clone (reflink)
+FICLONE = 0x40049409
+
+def directory_sync(src_dir, dest_dir, mode="copy", checksum=False, jobs=8, only=None, fingerprint=False, minify=False, shard=None):
     if not os.path.exists(src_dir):
         raise FileNotFoundError(f"Directory does not exist: {src_dir}")
-    if not os.path.exists(dest_dir):
-        os.mkdir(dest_dir)
-    src_items = os.listdir(src_dir)
-    for item in src_items:
-        src_path = os.path.join(src_dir, item)
-        dest_path = os.path.join(dest_dir, item)
-        if os.path.isfile(src_path):
-            shutil.copy(src_path, dest_dir)
-            print("copied:", item, "src:", src_path, "dest:", dest_path)
+    if mode not in file_transfers:
+        raise ValueError(f"Invalid sync mode: {mode}")
+    os.makedirs(dest_dir, exist_ok=True)
+    entries = manifest_load(dest_dir, "static")
+
+    if only is None:
+        files = {}
+        with instrument.span("static_copy.collect"):
+            src_rels = files_collect(src_dir)
+    else:
+        # only look at the given files, every other file stays as recorded
+        files = { src_rel: entry for src_rel, entry in entries.items() if src_rel not in only }
+        src_rels = [
+            src_rel
+            for src_rel in sorted(only)
+            if os.path.isfile(os.path.join(src_dir, src_rel))
+        ]
+
+    # a shard still looks at every file, fingerprints are needed for the full
+    # assets map, but only records and copies its own share
+    selected = None
+    if shard is not None:
+        selected = shard_select({ src_rel: os.path.getsize(os.path.join(src_dir, src_rel)) for src_rel in src_rels }, shard)
+    shard_files = {}
+
+    pending = []
+    unchanged = 0
+    for src_rel in src_rels:
+        src_path = os.path.join(src_dir, src_rel)
+        dest_path = os.path.join(dest_dir, src_rel)
+        src_stat = os.stat(src_path)
+        file = { "size": src_stat.st_size, "mtime": src_stat.st_mtime_ns }
+        entry = entries.get(src_rel)
+        minifier = file_minifiers.get(os.path.splitext(src_rel)[1]) if minify else None
+        if minifier is not None:
+            file["minify"] = True
+        if checksum or fingerprint:
+            file["hash"] = _file_checksum(src_path, file, entry)
+        fingerprint_path = None
+        if fingerprint:
+            # minified output differs from the source, so its name must too
+            content_hash = hash_str(file["hash"] + ":minify") if minifier is not None else file["hash"]
+            file["fingerprint"] = _file_fingerprint(src_rel, content_hash)
+            fingerprint_path = os.path.join(dest_dir, file["fingerprint"])
+        if selected is not None and src_rel not in selected:
+            shard_files[src_rel] = file
+            continue
+        files[src_rel] = file
+        if (
+            _file_unchanged(entry, file)
+            and os.path.exists(dest_path)
+            and (fingerprint_path is None or os.path.exists(fingerprint_path))
+        ):
+            unchanged += 1
         else:
-            directory_copy(src_path, dest_path)
+            pending.append((src_path, dest_path, fingerprint_path, minifier))
+
+    removed = 0
+    for src_rel, entry in entries.items():
+        file = files.get(src_rel)
+        stale = [] if file is not None else [src_rel]
+        if "fingerprint" in entry and (file is None or file.get("fingerprint") != entry["fingerprint"]):
+            stale.append(entry["fingerprint"])
+        for stale_rel in stale:
+            dest_path = os.path.join(dest_dir, stale_rel)
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+                removed += 1
+
+    transfer = file_transfers[mode]
+
+    def transfer_traced(paths):
+        src_path, dest_path, fingerprint_path, minifier = paths
+        with instrument.span("static_copy.transfer") as transfer_span:
+            saved = 0
+            if minifier is None:
+                nbytes = transfer(src_path, dest_path)
+            else:
+                nbytes = _file_minify(src_path, dest_path, minifier)
+                saved = os.path.getsize(src_path) - nbytes
+            # the plain name stays for references we can't rewrite, e.g. inside css
+            if fingerprint_path is not None:
+                _file_link(dest_path, fingerprint_path)
+            transfer_span.bytes_add(nbytes)
+        return nbytes, saved
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        sizes = list(executor.map(transfer_traced, pending))
+
+    manifest_save(dest_dir, "static", files)
+    copied_bytes = sum(size[0] for size in sizes)
+    summary = (
+        f"Synced {src_dir} to {dest_dir}: {len(pending)} copied ({copied_bytes} bytes), "
+        f"{unchanged} unchanged, {removed} removed"
+    )
+    if minify:
+        summary += f", {sum(size[1] for size in sizes)} bytes saved by minify"
+    print(summary)
+
+    assets = assets_map({ **files, **shard_files })
+    assets_path = os.path.join(dest_dir, assets_name)
+    if assets:
+        with open(assets_path, "w") as assets_file:
+            json.dump(assets, assets_file, indent=1, sort_keys=True)
+    elif os.path.exists(assets_path):
+        os.remove(assets_path)
+    return assets
+
+def assets_load(dest_dir):
+    return assets_map(manifest_load(dest_dir, "static"))
+
+def assets_map(files):
+    return {
+        "/" + src_rel.replace(os.sep, "/"): "/" + file["fingerprint"].replace(os.sep, "/")
+        for src_rel, file in files.items()
+        if "fingerprint" in file
+    }
+
+def _file_fingerprint(src_rel, file_hash):
+    root, ext = os.path.splitext(src_rel)
+    return f"{root}.{file_hash[:10]}{ext}"
+
+def files_collect(src_dir, rel_dir=""):
+    files = []
+    for item in sorted(os.listdir(os.path.join(src_dir, rel_dir))):
+        rel_path = os.path.join(rel_dir, item)
+        if os.path.isfile(os.path.join(src_dir, rel_path)):
+            files.append(rel_path)
+        else:
+            files.extend(files_collect(src_dir, rel_path))
+    return files
+
+def _file_unchanged(entry, file):
+    if entry is None or entry["size"] != file["size"]:
+        return False
+    if entry.get("minify") != file.get("minify"):
+        return False
+    if "hash" in file and "hash" in entry:
+        return entry["hash"] == file["hash"]
+    return entry["mtime"] == file["mtime"]
+
+def _file_checksum(src_path, file, entry):
+    # only hash when size or mtime moved, otherwise trust the recorded hash
+    if entry is not None and "hash" in entry:
+        if entry["size"] == file["size"] and entry["mtime"] == file["mtime"]:
+            return entry["hash"]
+    return hash_file(src_path)
+
+def _file_copy(src_path, dest_path):
+    _file_replace(dest_path, lambda tmp_path: shutil.copy2(src_path, tmp_path))
+    return os.path.getsize(src_path)
+
+def _file_link(src_path, dest_path):
+    try:
+        _file_replace(dest_path, lambda tmp_path: os.link(src_path, tmp_path))
+    except OSError:
+        return _file_copy(src_path, dest_path)
+    return os.path.getsize(src_path)
+
+def _file_clone(src_path, dest_path):
+    def clone(tmp_path):
+        with open(src_path, "rb") as src_file, open(tmp_path, "wb") as tmp_file:
+            try:
+                if fcntl is None:
+                    raise OSError("reflink is not supported")
+                fcntl.ioctl(tmp_file.fileno(), FICLONE, src_file.fileno())
+            except OSError:
+                _file_range_copy(src_file, tmp_file)
+        shutil.copystat(src_path, tmp_path)
+    _file_replace(dest_path, clone)
+    return os.path.getsize(src_path)
+
+def _file_minify(src_path, dest_path, minifier):
+    with open(src_path, "r", encoding="utf-8") as src_file:
+        data = minifier(src_file.read()).encode("utf-8")
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(data)
+        shutil.copystat(src_path, tmp_path)
+    _file_replace(dest_path, write)
+    return len(data)
+
+def _file_range_copy(src_file, dest_file):
+    size = os.fstat(src_file.fileno()).st_size
+    try:
+        offset = 0
+        while offset < size:
+            copied = os.copy_file_range(src_file.fileno(), dest_file.fileno(), size - offset)
+            if copied == 0:
+                break
+            offset += copied
+    except (OSError, AttributeError):
+        src_file.seek(0)
+        dest_file.seek(0)
+        dest_file.truncate()
+        shutil.copyfileobj(src_file, dest_file)
+
+def _file_replace(dest_path, create):
+    # never write through an existing destination, it may be a hard link
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = dest_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        create(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dest_path)
+
+file_transfers = {
+    "copy": _file_copy,
+    "link": _file_link,
+    "clone": _file_clone,
+}
@@ -1,9 +1,47 @@
+import gzip
+import io
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+import instrument
+from block_memo import BlockMemo
+from compress import directory_compress, sidecars_remove
+from fragment_cache import FragmentCache
 
 from html_node import HTMLNode, LeafNode, ParentNode
-from md_block import BlockType, _md_block_type, _md_inline_to_md_blocks
+from image_size import image_size
+from md_block import BlockType, _md_block_type, _md_inline_to_md_blocks, md_file_to_md_blocks
 from md_inline import _md_node_to_html_leaf_node, _md_inline_to_md_nodes, md_inline_to_html_node
 from md_node import MdNode, MdType
+from merge import shards_merge
+from minify import css_minify, html_minify
+from page_gen import pages_generate
+from page_template import PageTemplate
+from search_index import search_shard_name
+from shard import shard_parse, shard_select
+from site_api import Site
+from serve import RenderCache, base_path_strip, page_path_resolve
+from static_copy import directory_sync
+from watch import PollWatcher, dependency_graph
+
+class TempDirTestCase(unittest.TestCase):
+    # a fresh directory per test for the file fixtures of each class
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, path, text):
+        with open(path, "w") as file:
+            file.write(text)
+
+    def _read(self, path):
+        with open(path, "r") as file:
+            return file.read()
 
 class Test_HTMLNode(unittest.TestCase):
     def test_values(self):
@@ -57,6 +95,16 @@ class Test_LeafNode(unittest.TestCase):
         )
 
 class Test_ParentNode(unittest.TestCase):
+    def test_html_chunks(self):
+        parent_node = ParentNode("p", [LeafNode(None, "a "), LeafNode("b", "bold")])
+        self.assertEqual(list(parent_node.html_chunks()), ["<p>", "a ", "<b>bold</b>", "</p>"])
+
+    def test_write_html(self):
+        parent_node = ParentNode("div", [ParentNode("span", [LeafNode("i", "x")])])
+        fp = io.StringIO()
+        parent_node.write_html(fp)
+        self.assertEqual(fp.getvalue(), parent_node.to_html())
+
     def test_to_html_with_empty_children(self):
         parent_node = ParentNode("div", [])
         self.assertIsNotNone(parent_node.to_html()) 
@@ -77,6 +125,11 @@ class Test_MdNode(unittest.TestCase):
         node2 = MdNode("This is a text node", MdType.BOLD)
         self.assertNotEqual(node, node2)
     
+    def test_slots(self):
+        self.assertFalse(hasattr(MdNode("text", MdType.TEXT), "__dict__"))
+        self.assertFalse(hasattr(LeafNode("b", "bold"), "__dict__"))
+        self.assertFalse(hasattr(ParentNode("p", []), "__dict__"))
+
     def test_url_none(self):
         node = MdNode("This is a text node", MdType.TEXT, None)
         self.assertIsNotNone(node)
@@ -173,6 +226,32 @@ class Test_Md_To_Node(unittest.TestCase):
         self.assertEqual(image_node.text, "image")
         self.assertEqual(image_node.url, "https://example.com")
 
+    def test_md_nodes_bold_in_link(self):
+        nodes = _md_inline_to_md_nodes("Go [**home**](/) now")
+        self.assertEqual(len(nodes), 3)
+        link_node = nodes[1]
+        self.assertEqual(link_node.type, MdType.LINK)
+        self.assertEqual(link_node.url, "/")
+        self.assertEqual(link_node.children, [MdNode("home", MdType.BOLD)])
+
+    def test_md_nodes_link_in_italic(self):
+        nodes = _md_inline_to_md_nodes("_see [docs](/docs)_")
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(nodes[0].type, MdType.ITALIC)
+        self.assertEqual(
+            nodes[0].children,
+            [MdNode("see ", MdType.TEXT), MdNode("docs", MdType.LINK, "/docs")],
+        )
+
+    def test_md_nodes_url_with_underscores(self):
+        nodes = _md_inline_to_md_nodes("[link](/a_b_c)")
+        self.assertEqual(nodes, [MdNode("link", MdType.LINK, "/a_b_c")])
+
+    def test_html_node_nested(self):
+        node = MdNode("**home**", MdType.LINK, "/", [MdNode("home", MdType.BOLD)])
+        html_node = _md_node_to_html_leaf_node(node)
+        self.assertEqual(html_node.to_html(), "<a href=\"/\"><b>home</b></a>")
+
 class Test_Md_To_Blocks(unittest.TestCase):
     def test_md_to_blocks(self):
         text = """
@@ -194,6 +273,32 @@ This is the same paragraph on a new line
             ],
         )
     
+    def test_md_file_to_blocks(self):
+        text = "# Title\r\n\r\nSome **text**\nmore\n\n\n\n- a\n- b\n\n```\ncode\n```\n"
+        with tempfile.NamedTemporaryFile("wb", suffix=".md", delete=False) as md_file:
+            md_file.write(text.encode("utf-8"))
+        try:
+            blocks = list(md_file_to_md_blocks(md_file.name))
+        finally:
+            os.remove(md_file.name)
+        self.assertEqual(
+            blocks,
+            [
+                ("# Title", BlockType.HEADING),
+                ("Some **text**\nmore", BlockType.PARAGRAPH),
+                ("- a\n- b", BlockType.UNORDERED_LIST),
+                ("```\ncode\n```", BlockType.CODE),
+            ],
+        )
+
+    def test_md_file_to_blocks_empty(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".md", delete=False) as md_file:
+            pass
+        try:
+            self.assertEqual(list(md_file_to_md_blocks(md_file.name)), [])
+        finally:
+            os.remove(md_file.name)
+
     def test_md_block_type_deduce_paragraph(self):
         paragraph_block = "This is a normal paragraph block.\nWe added this newline to test."
         block_type = _md_block_type(paragraph_block)
@@ -284,6 +389,14 @@ class Test_Md_To_HTML(unittest.TestCase):
             "<div><ol><li>First item</li><li>Second item</li><li>Third item</li></ol></div>",
         )
 
+    def test_nested_inline(self):
+        md = "See [**the** docs](/docs) and _more [here](/more)_"
+        node = md_inline_to_html_node(md)
+        self.assertMultiLineEqual(
+            node.to_html(),
+            "<div><p>See <a href=\"/docs\"><b>the</b> docs</a> and <i>more <a href=\"/more\">here</a></i></p></div>",
+        )
+
     def test_mixed_content(self):
         md = "# Heading\n\nThis is **bold** text with _italic_ and `code`.\n\n- Item A\n- Item B\n\n1. Step 1\n2. Step 2"
         node = md_inline_to_html_node(md)
@@ -293,5 +406,629 @@ class Test_Md_To_HTML(unittest.TestCase):
             "<div><h1>Heading</h1><p>This is <b>bold</b> text with <i>italic</i> and <code>code</code>.</p><ul><li>Item A</li><li>Item B</li></ul><ol><li>Step 1</li><li>Step 2</li></ol></div>",
         )
 
+class Test_PageTemplate(unittest.TestCase):
+    def test_render_slots(self):
+        template = PageTemplate("<title>{{ Title }}</title>{{ Content }}{{ Footer }}")
+        self.assertEqual(
+            template.render({ "Title": "T", "Content": "<p>c</p>", "Footer": "f" }),
+            "<title>T</title><p>c</p>f",
+        )
+
+    def test_render_missing_slot_kept(self):
+        template = PageTemplate("<p>{{ Unknown }}</p>")
+        self.assertEqual(template.render({}), "<p>{{ Unknown }}</p>")
+
+    def test_base_path_rewrites_template_only(self):
+        template = PageTemplate('<link href="/index.css" /><img src="/a.png">{{ Content }}', "/base")
+        self.assertEqual(
+            template.render({ "Content": 'href="/raw' }),
+            '<link href="/base/index.css" /><img src="/base/a.png">href="/raw',
+        )
+
+    def test_write_streams_chunks(self):
+        template = PageTemplate("<main>{{ Content }}</main>")
+        fp = io.StringIO()
+        template.write(fp, { "Content": iter(["<p>", "a", "</p>"]) })
+        self.assertEqual(fp.getvalue(), "<main><p>a</p></main>")
+
+    def test_assets_rewrite(self):
+        assets = { "/index.css": "/index.0123456789.css" }
+        template = PageTemplate('<link href="/index.css" />{{ Content }}', "/base", assets)
+        self.assertEqual(template.render({ "Content": "" }), '<link href="/base/index.0123456789.css" />')
+        self.assertEqual(template.url_rewrite("/index.css"), "/base/index.0123456789.css")
+        self.assertEqual(template.url_rewrite("/other.css"), "/base/other.css")
+
+    def test_url_rewrite(self):
+        template = PageTemplate("", "/base")
+        self.assertEqual(template.url_rewrite("/images/a.png"), "/base/images/a.png")
+        self.assertEqual(template.url_rewrite("https://example.com"), "https://example.com")
+
+    def test_inline_css(self):
+        with tempfile.TemporaryDirectory() as css_dir:
+            with open(os.path.join(css_dir, "small.css"), "w") as css_file:
+                css_file.write("body { background: url(images/bg.png); }")
+            with open(os.path.join(css_dir, "large.css"), "w") as css_file:
+                css_file.write("p { color: red; }" * 10)
+            template = PageTemplate(
+                '<head><link rel="stylesheet" href="/small.css" /><link rel="stylesheet" href="/large.css" /></head>{{ Content }}',
+                "/base", minify=True, css_dir=css_dir, css_inline_max=64,
+            )
+        self.assertEqual(
+            template.render({ "Content": "", "Preload": "" }),
+            '<head><link rel="preload" href="/base/large.css" as="style" />'
+            '<style>body{background:url(/base/images/bg.png)}</style>'
+            '<link rel="stylesheet" href="/base/large.css" /></head>',
+        )
+        self.assertIn("Preload", template.slots)
+        self.assertEqual(len(template.css_sources), 2)
+
+class Test_Pages_Generate(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.tmp.name, "content")
+        self.dest_dir = os.path.join(self.tmp.name, "public")
+        self.template_path = os.path.join(self.tmp.name, "template.html")
+        os.makedirs(os.path.join(self.src_dir, "blog"))
+        self._write(self.template_path, "<title>{{ Title }}</title><main>{{ Content }}</main>")
+        self._write(os.path.join(self.src_dir, "index.md"), "# Home\n\n[post](/blog/post)")
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\nBody")
+
+    def _generate(self, base_path=""):
+        pages_generate(base_path, self.template_path, self.src_dir, self.dest_dir)
+
+    def test_generates_pages(self):
+        self._generate("/base")
+        self.assertEqual(
+            self._read(os.path.join(self.dest_dir, "index.html")),
+            "<title>Home</title><main><div><h1>Home</h1><p><a href=\"/base/blog/post\">post</a></p></div></main>",
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.dest_dir, "blog", "post.html")))
+
+    def test_unchanged_pages_skipped(self):
+        self._generate()
+        post_path = os.path.join(self.dest_dir, "blog", "post.html")
+        self._write(post_path, "untouched")
+        self._write(os.path.join(self.src_dir, "index.md"), "# Home\n\nEdited")
+        self._generate()
+        self.assertEqual(self._read(post_path), "untouched")
+        self.assertIn("Edited", self._read(os.path.join(self.dest_dir, "index.html")))
+
+    def test_template_change_rebuilds(self):
+        self._generate()
+        post_path = os.path.join(self.dest_dir, "blog", "post.html")
+        self._write(post_path, "untouched")
+        self._generate("/base")
+        self.assertNotEqual(self._read(post_path), "untouched")
+
+    def test_parallel_matches_serial(self):
+        self._generate("/base")
+        serial = self._read(os.path.join(self.dest_dir, "blog", "post.html"))
+        dest_dir = self.dest_dir
+        self.dest_dir = os.path.join(self.tmp.name, "parallel")
+        pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, jobs=2)
+        self.assertEqual(self._read(os.path.join(self.dest_dir, "blog", "post.html")), serial)
+        self.dest_dir = dest_dir
+
+    def test_failed_page_reported(self):
+        self._write(os.path.join(self.src_dir, "blog", "broken.md"), "no title here")
+        with self.assertRaises(Exception):
+            self._generate()
+        self.assertTrue(os.path.exists(os.path.join(self.dest_dir, "blog", "post.html")))
+
+    def test_only_given_sources(self):
+        self._generate()
+        post_path = os.path.join(self.dest_dir, "blog", "post.html")
+        self._write(post_path, "untouched")
+        self._write(os.path.join(self.src_dir, "index.md"), "# Home\n\nEdited")
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\nEdited")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, only={"index.md"})
+        self.assertEqual(self._read(post_path), "untouched")
+        self.assertIn("Edited", self._read(os.path.join(self.dest_dir, "index.html")))
+
+    def test_profile_records_page_stages(self):
+        instrument.enable()
+        try:
+            self._generate()
+            events = instrument.events_drain()
+        finally:
+            instrument.enabled = False
+        pages = [event for event in events if event["name"] == "page"]
+        self.assertEqual(len(pages), 2)
+        stages = pages[0]["args"]["stages"]
+        for stage in ("md_block.scan", "md_inline.tokenize", "html_node.serialize", "page_gen.write"):
+            self.assertIn(stage, stages)
+        self._write(os.path.join(self.src_dir, "index.md"), "# Home\n\nEdited")
+        self._generate()
+        self.assertEqual(instrument.events_drain(), [])
+
+    def test_fragment_cache_skips_parsing(self):
+        cache = FragmentCache(os.path.join(self.tmp.name, "cache"))
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, cache=cache)
+        self._write(self.template_path, "<h2>{{ Title }}</h2>{{ Content }}")
+        with mock.patch("page_gen.md_file_to_md_blocks", side_effect=AssertionError("parsed")):
+            pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, cache=cache)
+        self.assertEqual(
+            self._read(os.path.join(self.dest_dir, "index.html")),
+            "<h2>Home</h2><div><h1>Home</h1><p><a href=\"/base/blog/post\">post</a></p></div>",
+        )
+
+    def test_fragment_cache_eviction(self):
+        cache = FragmentCache(os.path.join(self.tmp.name, "cache"), max_bytes=0)
+        nodes = list(cache.store("hash", "Title", [LeafNode("p", "x")]))
+        self.assertEqual(nodes[0].to_html(), "<p>x</p>")
+        title, cached_nodes = cache.get("hash")
+        self.assertEqual((title, [node.to_html() for node in cached_nodes]), ("Title", ["<p>x</p>"]))
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get("hash"))
+
+    def test_block_memo_shared_blocks(self):
+        memo = BlockMemo(os.path.join(self.tmp.name, "blocks.sqlite"), min_block=0)
+        for path in (os.path.join(self.src_dir, "index.md"), os.path.join(self.src_dir, "blog", "post.md")):
+            self._write(path, "# Page\n\n[shared](/blog/post)")
+        pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, jobs=2, memo=memo)
+        self.assertEqual(
+            self._read(os.path.join(self.dest_dir, "blog", "post.html")),
+            "<title>Page</title><main><div><h1>Page</h1><p><a href=\"/base/blog/post\">shared</a></p></div></main>",
+        )
+        self.assertEqual(memo.stats, { "hits": 0, "misses": 0, "evictions": 0 })
+
+    def test_block_memo_hits_and_eviction(self):
+        memo = BlockMemo(os.path.join(self.tmp.name, "blocks.sqlite"), max_entries=1, min_block=0)
+        first = memo.render("[a](/a)")
+        first.children[0].props["href"] = "/base/a"
+        memo.render("**b**")
+        memo.flush()
+        # hits are fresh copies, untouched by rewrites of earlier ones
+        self.assertEqual(memo.render("[a](/a)").to_html(), "<p><a href=\"/a\">a</a></p>")
+        memo.flush()
+        self.assertEqual(memo.evict(), 1)
+        self.assertEqual(memo.render("**b**").to_html(), "<p><b>b</b></p>")
+        self.assertEqual(memo.stats_drain(), { "hits": 1, "misses": 3, "evictions": 1 })
+
+    def test_block_memo_flushes_during_page(self):
+        memo = BlockMemo(os.path.join(self.tmp.name, "blocks.sqlite"), min_block=0)
+        with mock.patch("block_memo.flush_blocks", 2):
+            memo.render("**a**")
+            self.assertEqual(len(memo._stored), 1)
+            memo.render("**b**")
+            self.assertEqual(memo._stored, [])
+        count = memo._connection().execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+        self.assertEqual(count, 2)
+
+    def test_removed_source_deletes_output(self):
+        self._generate()
+        os.remove(os.path.join(self.src_dir, "blog", "post.md"))
+        self._generate()
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "blog")))
+        self.assertTrue(os.path.exists(os.path.join(self.dest_dir, "index.html")))
+
+    def test_image_attrs(self):
+        static_dir = os.path.join(self.tmp.name, "static")
+        os.makedirs(os.path.join(static_dir, "images"))
+        image_path = os.path.join(static_dir, "images", "a.gif")
+        with open(image_path, "wb") as image_file:
+            image_file.write(b"GIF89a\x20\x00\x10\x00")
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\n![a](/images/a.gif)\n\n![b](/images/a.gif)")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, images=static_dir)
+        post_path = os.path.join(self.dest_dir, "blog", "post.html")
+        self.assertIn(
+            '<img src="/images/a.gif" alt="a" width="32" height="16" decoding="async">'
+            '</p><p><img src="/images/a.gif" alt="b" width="32" height="16" loading="lazy" decoding="async">',
+            self._read(post_path),
+        )
+        with open(image_path, "wb") as image_file:
+            image_file.write(b"GIF89a\x40\x00\x10\x00")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, images=static_dir)
+        self.assertIn('width="64"', self._read(post_path))
+
+    def test_inline_css_preloads_first_image(self):
+        static_dir = os.path.join(self.tmp.name, "static")
+        os.makedirs(static_dir)
+        self._write(os.path.join(static_dir, "index.css"), "p { color: red; }")
+        self._write(self.template_path, '<head><link rel="stylesheet" href="/index.css" /></head>{{ Content }}')
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\n![a](/images/a.png)\n\n![b](/images/b.png)")
+        pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, css_dir=static_dir)
+        post_path = os.path.join(self.dest_dir, "blog", "post.html")
+        self.assertTrue(self._read(post_path).startswith(
+            '<head><style>p { color: red; }</style><link rel="preload" href="/base/images/a.png" as="image" /></head>'
+        ))
+        self.assertTrue(self._read(os.path.join(self.dest_dir, "index.html")).startswith("<head><style>p { color: red; }</style></head>"))
+        self._write(os.path.join(static_dir, "index.css"), "p { color: blue; }")
+        pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, css_dir=static_dir)
+        self.assertIn("color: blue", self._read(post_path))
+
+    def test_image_attrs_jobs_keep_image_entries(self):
+        static_dir = os.path.join(self.tmp.name, "static")
+        os.makedirs(os.path.join(static_dir, "images"))
+        with open(os.path.join(static_dir, "images", "a.gif"), "wb") as image_file:
+            image_file.write(b"GIF89a\x20\x00\x10\x00")
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\n![a](/images/a.gif)")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, jobs=2, images=static_dir)
+        manifest = json.loads(self._read(os.path.join(self.dest_dir, ".manifest.json")))
+        self.assertEqual([entry[1:] for entry in manifest["images"].values()], [[32, 16]])
+        self.assertEqual(list(manifest["images"]), ["images/a.gif"])
+
+    def test_search_index(self):
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\n## Rivers\n\nrivers and hills\n\n```rivers```")
+        pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, search=True)
+        search_dir = os.path.join(self.dest_dir, "search")
+        self.assertEqual(
+            json.loads(self._read(os.path.join(search_dir, "index.json"))),
+            { "prefix": 2, "docs": [["/base/blog/post.html", "Post"], ["/base/", "Home"]] },
+        )
+        self.assertEqual(json.loads(self._read(os.path.join(search_dir, "ri.json"))), { "rivers": [[0, 5]] })
+        self.assertEqual(json.loads(self._read(os.path.join(search_dir, "po.json"))), { "post": [[0, 12], [1, 1]] })
+        os.remove(os.path.join(self.src_dir, "blog", "post.md"))
+        pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, search=True)
+        self.assertFalse(os.path.exists(os.path.join(search_dir, "ri.json")))
+        self.assertEqual(json.loads(self._read(os.path.join(search_dir, "po.json"))), { "post": [[0, 1]] })
+
+    def test_search_docs_outside_manifest(self):
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, search=True)
+        manifest = json.loads(self._read(os.path.join(self.dest_dir, ".manifest.json")))
+        self.assertNotIn("search", manifest)
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Renamed\n\nBody")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir)
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, search=True)
+        docs = json.loads(self._read(os.path.join(self.dest_dir, ".search.json")))
+        self.assertEqual(docs[os.path.join("blog", "post.md")]["title"], "Renamed")
+
+    def test_search_index_keeps_sidecars(self):
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, search=True)
+        directory_compress(self.dest_dir, min_size=0)
+        sidecar_path = os.path.join(self.dest_dir, "search", "index.json.gz")
+        self.assertTrue(os.path.exists(sidecar_path))
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, search=True)
+        self.assertTrue(os.path.exists(sidecar_path))
+
+    def test_blog_index_listings(self):
+        for name in ("a", "b"):
+            self._write(os.path.join(self.src_dir, "blog", f"{name}.md"), f"# Post {name}\n\none two [home](/)")
+        with mock.patch("page_gen.listing_per_page", 2):
+            pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, index=True)
+            self.assertEqual(
+                self._read(os.path.join(self.dest_dir, "blog", "index.html")),
+                '<title>Blog</title><main><div><h1>Blog</h1><ul>'
+                '<li><a href="/base/blog/a.html">Post a</a> (5 words)</li>'
+                '<li><a href="/base/blog/b.html">Post b</a> (5 words)</li></ul>'
+                '<p><a href="/base/blog/page/2/">Next ></a></p></div></main>',
+            )
+            self.assertIn("Post</a> (2 words)", self._read(os.path.join(self.dest_dir, "blog", "page", "2", "index.html")))
+            os.remove(os.path.join(self.src_dir, "blog", "post.md"))
+            with mock.patch("page_gen.md_file_to_md_blocks", side_effect=AssertionError("parsed")):
+                pages_generate("/base", self.template_path, self.src_dir, self.dest_dir, index=True)
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "blog", "page")))
+        self.assertNotIn("Next", self._read(os.path.join(self.dest_dir, "blog", "index.html")))
+
+    def test_blog_index_rows_follow_edits_made_without_it(self):
+        listing_path = os.path.join(self.dest_dir, "blog", "index.html")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, index=True)
+        self.assertIn(">Post</a>", self._read(listing_path))
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Renamed\n\nBody")
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir)
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, index=True)
+        self.assertIn(">Renamed</a>", self._read(listing_path))
+
+    def test_blog_index_listings_inline_css(self):
+        static_dir = os.path.join(self.tmp.name, "static")
+        os.makedirs(static_dir)
+        self._write(os.path.join(static_dir, "index.css"), "p { color: red; }")
+        self._write(self.template_path, '<head><link rel="stylesheet" href="/index.css" /></head>{{ Content }}')
+        pages_generate("", self.template_path, self.src_dir, self.dest_dir, index=True, css_dir=static_dir)
+        self.assertEqual(
+            self._read(os.path.join(self.dest_dir, "blog", "index.html")),
+            '<head><style>p { color: red; }</style></head><div><h1>Blog</h1><ul>'
+            '<li><a href="/blog/post.html">Post</a> (2 words)</li></ul></div>',
+        )
+
+    def test_search_shard_name(self):
+        self.assertEqual(search_shard_name("rivers"), "ri")
+        self.assertEqual(search_shard_name("élan"), "_e9l")
+
+class Test_Image_Size(TempDirTestCase):
+
+    def _size(self, data):
+        path = os.path.join(self.tmp.name, "image")
+        with open(path, "wb") as image_file:
+            image_file.write(data)
+        return image_size(path)
+
+    def test_png(self):
+        data = b"\x89PNG\r\n\x1a\n\x00\x00\x00\x0dIHDR\x00\x00\x04\x4c\x00\x00\x01\xb6" + bytes(8)
+        self.assertEqual(self._size(data), (1100, 438))
+
+    def test_gif(self):
+        self.assertEqual(self._size(b"GIF87a\x0a\x00\x05\x00" + bytes(8)), (10, 5))
+
+    def test_jpeg(self):
+        app0 = b"\xff\xe0\x00\x10JFIF\x00" + bytes(9)
+        sof0 = b"\xff\xc0\x00\x11\x08\x00\x30\x00\x40" + bytes(10)
+        self.assertEqual(self._size(b"\xff\xd8" + app0 + sof0), (64, 48))
+
+    def test_webp(self):
+        vp8x = b"RIFF\x00\x00\x00\x00WEBPVP8X\x0a\x00\x00\x00" + bytes(4) + b"\x63\x00\x00\xc7\x00\x00"
+        self.assertEqual(self._size(vp8x), (100, 200))
+        vp8l = b"RIFF\x00\x00\x00\x00WEBPVP8L\x00\x00\x00\x00\x2f" + (9 | 19 << 14).to_bytes(4, "little")
+        self.assertEqual(self._size(vp8l), (10, 20))
+
+    def test_unknown(self):
+        self.assertIsNone(self._size(b"not an image"))
+
+class Test_Serve(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.tmp.name, "content")
+        self.template_path = os.path.join(self.tmp.name, "template.html")
+        self.page_path = os.path.join(self.src_dir, "blog", "post", "index.md")
+        os.makedirs(os.path.dirname(self.page_path))
+        self._write(self.template_path, "{{ Title }}|{{ Content }}")
+        self._write(self.page_path, "# Post\n\nBody")
+
+    def test_page_path_resolve(self):
+        for url_path in ("/blog/post", "/blog/post/", "/blog/post/index.html"):
+            self.assertEqual(page_path_resolve(self.src_dir, url_path), self.page_path)
+        self.assertIsNone(page_path_resolve(self.src_dir, "/missing"))
+        self.assertIsNone(page_path_resolve(self.src_dir, "/../template.html"))
+
+    def test_base_path_strip(self):
+        self.assertEqual(base_path_strip("", "/blog/post"), "/blog/post")
+        self.assertEqual(base_path_strip("/base", "/base/index.css"), "/index.css")
+        self.assertEqual(base_path_strip("/base/", "/base"), "/")
+        self.assertIsNone(base_path_strip("/base", "/basement/index.css"))
+        self.assertIsNone(base_path_strip("/base", "/index.css"))
+
+    def test_render_cache_invalidated_by_mtime(self):
+        render_cache = RenderCache(self.template_path)
+        self.assertEqual(render_cache.page(self.page_path), b"Post|<div><h1>Post</h1><p>Body</p></div>")
+        self.assertIs(render_cache.page(self.page_path), render_cache.page(self.page_path))
+        self._write(self.page_path, "# Post\n\nEdited")
+        os.utime(self.page_path, ns=(0, 1))
+        self.assertIn(b"Edited", render_cache.page(self.page_path))
+
+class Test_Directory_Sync(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.tmp.name, "static")
+        self.dest_dir = os.path.join(self.tmp.name, "public")
+        os.makedirs(os.path.join(self.src_dir, "images"))
+        self._write(os.path.join(self.src_dir, "index.css"), "body {}")
+        self._write(os.path.join(self.src_dir, "images", "a.png"), "png")
+
+    def test_copies_files(self):
+        directory_sync(self.src_dir, self.dest_dir)
+        self.assertEqual(self._read(os.path.join(self.dest_dir, "index.css")), "body {}")
+        self.assertEqual(self._read(os.path.join(self.dest_dir, "images", "a.png")), "png")
+
+    def test_unchanged_files_skipped(self):
+        directory_sync(self.src_dir, self.dest_dir)
+        dest_path = os.path.join(self.dest_dir, "index.css")
+        self._write(dest_path, "untouched")
+        directory_sync(self.src_dir, self.dest_dir)
+        self.assertEqual(self._read(dest_path), "untouched")
+
+    def test_stale_files_removed(self):
+        directory_sync(self.src_dir, self.dest_dir)
+        os.remove(os.path.join(self.src_dir, "images", "a.png"))
+        directory_sync(self.src_dir, self.dest_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "images", "a.png")))
+
+    def test_fingerprint(self):
+        assets = directory_sync(self.src_dir, self.dest_dir, fingerprint=True)
+        fingerprinted = assets["/index.css"]
+        self.assertRegex(fingerprinted, r"^/index\.[0-9a-f]{10}\.css$")
+        self.assertEqual(self._read(self.dest_dir + fingerprinted), "body {}")
+        self.assertTrue(os.path.exists(os.path.join(self.dest_dir, "index.css")))
+        self._write(os.path.join(self.src_dir, "index.css"), "body { margin: 0 }")
+        assets = directory_sync(self.src_dir, self.dest_dir, fingerprint=True)
+        self.assertNotEqual(assets["/index.css"], fingerprinted)
+        self.assertFalse(os.path.exists(self.dest_dir + fingerprinted))
+
+    def test_minify_css(self):
+        self._write(os.path.join(self.src_dir, "index.css"), "body {\n  color: red;\n}\n")
+        directory_sync(self.src_dir, self.dest_dir, minify=True)
+        dest_path = os.path.join(self.dest_dir, "index.css")
+        self.assertEqual(self._read(dest_path), "body{color:red}")
+        self.assertEqual(self._read(os.path.join(self.dest_dir, "images", "a.png")), "png")
+        directory_sync(self.src_dir, self.dest_dir)
+        self.assertEqual(self._read(dest_path), "body {\n  color: red;\n}\n")
+
+    def test_link_and_clone_modes(self):
+        for mode in ("link", "clone"):
+            dest_dir = os.path.join(self.tmp.name, mode)
+            directory_sync(self.src_dir, dest_dir, mode=mode)
+            self.assertEqual(self._read(os.path.join(dest_dir, "index.css")), "body {}")
+
+class Test_Minify(unittest.TestCase):
+    def test_html_collapses_indentation(self):
+        html = "<html>\n  <head>\n    <title>{{ Title }}</title>\n  </head>\n</html>\n"
+        self.assertEqual(html_minify(html), "<html><head><title>{{ Title }}</title></head></html>")
+
+    def test_html_keeps_inline_space(self):
+        self.assertEqual(html_minify("<b>a</b> <i>b</i>   c"), "<b>a</b> <i>b</i> c")
+
+    def test_html_keeps_pre(self):
+        html = "<div>\n  <pre><code>\nif x:\n    y()\n</code></pre>\n</div>"
+        self.assertEqual(html_minify(html), "<div><pre><code>\nif x:\n    y()\n</code></pre></div>")
+
+    def test_css(self):
+        css = "/* theme */\nh1, h2 {\n  font-family: \"A  B\", serif;\n  margin: 0 auto;\n}\n"
+        self.assertEqual(css_minify(css), 'h1,h2{font-family:"A  B",serif;margin:0 auto}')
+
+    def test_template(self):
+        template = PageTemplate("<p>\n  {{ Content }}\n</p>\n", minify=True)
+        self.assertEqual(template.render({ "Content": "<pre>a\n  b</pre>" }), "<p> <pre>a\n  b</pre> </p>")
+        self.assertEqual(template.saved_bytes, 3)
+
+class Test_Shard(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.tmp.name, "content")
+        self.static_dir = os.path.join(self.tmp.name, "static")
+        self.template_path = os.path.join(self.tmp.name, "template.html")
+        os.makedirs(self.src_dir)
+        os.makedirs(self.static_dir)
+        self._write(self.template_path, '<link href="/index.css">{{ Content }}')
+        for i in range(5):
+            self._write(os.path.join(self.src_dir, f"page{i}.md"), f"# Page {i}\n\n" + "text " * (i + 1))
+            self._write(os.path.join(self.static_dir, f"file{i}.css"), "b {}" * (i + 1))
+        self._write(os.path.join(self.static_dir, "index.css"), "body {}")
+
+    def _build(self, dest_dir, shard=None):
+        assets = directory_sync(self.static_dir, dest_dir, fingerprint=True, shard=shard)
+        pages_generate("", self.template_path, self.src_dir, dest_dir, assets=assets, search=True, shard=shard)
+
+    def _tree(self, root):
+        tree = {}
+        for dir, _, files in os.walk(root):
+            for file in files:
+                with open(os.path.join(dir, file), "rb") as tree_file:
+                    tree[os.path.relpath(os.path.join(dir, file), root)] = tree_file.read()
+        return tree
+
+    def test_select_balanced(self):
+        sizes = { f"file{i}": size for i, size in enumerate([9, 7, 5, 3, 3, 1]) }
+        shards = [shard_select(sizes, (index, 2)) for index in range(2)]
+        self.assertEqual(shards[0] | shards[1], set(sizes))
+        self.assertEqual(shards[0] & shards[1], set())
+        self.assertEqual(sorted(sum(sizes[rel] for rel in shard) for shard in shards), [13, 15])
+        self.assertEqual(shard_parse("2/3"), (1, 3))
+
+    def test_merge_matches_full_build(self):
+        full_dir = os.path.join(self.tmp.name, "full")
+        self._build(full_dir)
+        shard_dirs = [os.path.join(self.tmp.name, f"shard{i}") for i in range(3)]
+        for index, shard_dir in enumerate(shard_dirs):
+            self._build(shard_dir, (index, 3))
+        merged_dir = os.path.join(self.tmp.name, "merged")
+        shards_merge(shard_dirs, merged_dir)
+        self.assertEqual(self._tree(merged_dir), self._tree(full_dir))
+
+    def test_pages_split_ignores_src_dir_spelling(self):
+        # equal sizes, the split is decided by the tie-break hash
+        for i in range(5):
+            self._write(os.path.join(self.src_dir, f"page{i}.md"), f"# Page {i}")
+        outputs = []
+        for index, src_dir in enumerate((self.src_dir, os.path.relpath(self.src_dir) + os.sep)):
+            dest_dir = os.path.join(self.tmp.name, f"shard{index}")
+            pages_generate("", self.template_path, src_dir, dest_dir, shard=(0, 2))
+            outputs.append(sorted(name for name in os.listdir(dest_dir) if name.endswith(".html")))
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_merge_conflict(self):
+        shard_dirs = [os.path.join(self.tmp.name, f"shard{i}") for i in range(2)]
+        for index, shard_dir in enumerate(shard_dirs):
+            self._build(shard_dir, (index, 2))
+        self._write(os.path.join(shard_dirs[1], "page0.html"), "conflict")
+        self._write(os.path.join(shard_dirs[0], "page0.html"), "other")
+        with self.assertRaises(Exception):
+            shards_merge(shard_dirs, os.path.join(self.tmp.name, "merged"))
+
+class Test_Site(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.tmp.name, "content")
+        self.static_dir = os.path.join(self.tmp.name, "static")
+        self.dest_dir = os.path.join(self.tmp.name, "public")
+        self.template_path = os.path.join(self.tmp.name, "template.html")
+        os.makedirs(os.path.join(self.src_dir, "blog"))
+        os.makedirs(self.static_dir)
+        self._write(self.template_path, "<title>{{ Title }}</title>{{ Content }}")
+        self._write(os.path.join(self.static_dir, "index.css"), "body {}")
+        self._write(os.path.join(self.src_dir, "index.md"), "# Home\n\nHello")
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\nBody")
+        self.site = Site(
+            "/base", self.dest_dir, self.src_dir, self.static_dir, self.template_path,
+            cache_dir=None, memo_path=None,
+        )
+
+    def test_render_string(self):
+        html = self.site.render_string("# Draft\n\n[home](/)")
+        self.assertEqual(html, '<title>Draft</title><div><h1>Draft</h1><p><a href="/base/">home</a></p></div>')
+        self.assertIs(self.site.render_string("# Draft\n\n[home](/)"), html)
+
+    def test_build_all_and_page(self):
+        self.site.build_all()
+        self.assertEqual(self._read(os.path.join(self.dest_dir, "index.css")), "body {}")
+        post_path = os.path.join(self.dest_dir, "blog", "post.html")
+        self.assertIn("Body", self._read(post_path))
+        self._write(os.path.join(self.src_dir, "index.md"), "# Home\n\nEdited")
+        self._write(os.path.join(self.src_dir, "blog", "post.md"), "# Post\n\nEdited")
+        self.assertEqual(self.site.build_page("blog/post.md"), post_path)
+        self.assertIn("Edited", self._read(post_path))
+        self.assertIn("Hello", self._read(os.path.join(self.dest_dir, "index.html")))
+
+class Test_Compress(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dest_dir = self.tmp.name
+        self.page_path = os.path.join(self.dest_dir, "blog", "index.html")
+        os.makedirs(os.path.dirname(self.page_path))
+        self._write(self.page_path, "<p>compress me</p>" * 100)
+        self._write(os.path.join(self.dest_dir, "small.css"), "b {}")
+        self._write(os.path.join(self.dest_dir, "image.png"), "png" * 1000)
+
+    def test_sidecars(self):
+        directory_compress(self.dest_dir, min_size=100)
+        with gzip.open(self.page_path + ".gz", "rt") as sidecar:
+            self.assertEqual(sidecar.read(), "<p>compress me</p>" * 100)
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "small.css.gz")))
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "image.png.gz")))
+
+    def test_unchanged_skipped_and_stale_removed(self):
+        directory_compress(self.dest_dir, min_size=100)
+        mtime = os.stat(self.page_path + ".gz").st_mtime_ns
+        os.utime(self.page_path + ".gz", ns=(0, 0))
+        directory_compress(self.dest_dir, min_size=100)
+        self.assertEqual(os.stat(self.page_path + ".gz").st_mtime_ns, 0)
+        self.assertNotEqual(mtime, 0)
+        os.remove(self.page_path)
+        directory_compress(self.dest_dir, min_size=100)
+        self.assertFalse(os.path.exists(self.page_path + ".gz"))
+
+    def test_sidecars_removed_without_compression(self):
+        directory_compress(self.dest_dir, min_size=100)
+        sidecars_remove(self.dest_dir)
+        self.assertFalse(os.path.exists(self.page_path + ".gz"))
+        self.assertTrue(os.path.exists(self.page_path))
+
+class Test_Watch(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.tmp.name, "content")
+        self.static_dir = os.path.join(self.tmp.name, "static")
+        self.template_path = os.path.join(self.tmp.name, "template.html")
+        os.makedirs(os.path.join(self.src_dir, "blog"))
+        os.makedirs(self.static_dir)
+        for path in (
+            self.template_path,
+            os.path.join(self.src_dir, "index.md"),
+            os.path.join(self.src_dir, "blog", "post.md"),
+            os.path.join(self.static_dir, "index.css"),
+        ):
+            self._write(path, "# x")
+
+    def test_dependency_graph(self):
+        graph = dependency_graph(self.template_path, self.src_dir, self.static_dir, "public")
+        self.assertEqual(
+            graph.affected([os.path.join(self.src_dir, "blog", "post.md")]),
+            {("page", os.path.join("blog", "post.md"))},
+        )
+        self.assertEqual(
+            graph.affected([self.template_path]),
+            {("page", "index.md"), ("page", os.path.join("blog", "post.md"))},
+        )
+        self.assertEqual(
+            graph.affected([os.path.join(self.static_dir, "index.css")]),
+            {("asset", "index.css")},
+        )
+
+    def test_poll_watcher(self):
+        watcher = PollWatcher([self.src_dir, self.template_path], interval=0.01)
+        self.assertEqual(watcher.wait(0), set())
+        new_path = os.path.join(self.src_dir, "new.md")
+        with open(new_path, "w") as file:
+            file.write("# new")
+        self.assertEqual(watcher.wait(1), {os.path.normpath(new_path)})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,275 @@
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from compress import directory_compress
+from manifest import manifest_load
+from page_gen import pages_collect, pages_generate
+from static_copy import assets_load, directory_sync, files_collect
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+inotify_mask = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+inotify_event = struct.Struct("iIII")
+
+class DependencyGraph:
+    def __init__(self):
+        self.dependents = {}
+
+    def add(self, source, target):
+        self.dependents.setdefault(os.path.normpath(source), set()).add(target)
+
+    def remove(self, source, target):
+        targets = self.dependents.get(os.path.normpath(source))
+        if targets is None:
+            return
+        targets.discard(target)
+        if not targets:
+            del self.dependents[os.path.normpath(source)]
+
+    def affected(self, paths):
+        targets = set()
+        for path in paths:
+            targets |= self.dependents.get(os.path.normpath(path), set())
+        return targets
+
+    def __repr__(self):
+        return f"DependencyGraph({len(self.dependents)} sources)"
+
+def dependency_graph(template_path, src_dir, static_dir, dest_dir):
+    graph = DependencyGraph()
+    for src_path, _ in pages_collect(src_dir, dest_dir):
+        page = ("page", os.path.relpath(src_path, src_dir))
+        graph.add(src_path, page)
+        graph.add(template_path, page)
+    for src_rel in files_collect(static_dir):
+        graph.add(os.path.join(static_dir, src_rel), ("asset", src_rel))
+    return graph
+
+def _graph_update(graph, path, template_path, src_dir, static_dir):
+    # new and deleted files change the graph before it can be queried
+    for root, kind in ((src_dir, "page"), (static_dir, "asset")):
+        rel = os.path.relpath(path, root)
+        if rel.startswith(os.pardir):
+            continue
+        target = (kind, rel)
+        sources = [path, template_path] if kind == "page" else [path]
+        if os.path.isfile(path):
+            for source in sources:
+                graph.add(source, target)
+            return None
+
+        # keep the edges until the rebuild has removed the output
+        def cleanup():
+            for source in sources:
+                graph.remove(source, target)
+        return cleanup
+    return None
+
+def _pages_using_images(dest_dir, asset_rels):
+    # pages record the images they were sized from, see pages_generate
+    image_rels = { rel.replace(os.sep, "/") for rel in asset_rels }
+    entries = manifest_load(dest_dir, "pages").get("entries", {})
+    return {
+        src_rel
+        for src_rel, entry in entries.items()
+        if image_rels.intersection(entry.get("images", {}))
+    }
+
+class PollWatcher:
+    def __init__(self, paths, interval=0.25):
+        self.paths = paths
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                self._scan_dir(path, snapshot)
+            elif os.path.exists(path):
+                stat = os.stat(path)
+                snapshot[os.path.normpath(path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _scan_dir(self, dir, snapshot):
+        with os.scandir(dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    self._scan_dir(entry.path, snapshot)
+                else:
+                    stat = entry.stat()
+                    snapshot[os.path.normpath(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("inotify is not available")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.paths = [os.path.normpath(path) for path in paths]
+        for path in paths:
+            self._watch(path)
+
+    def _watch(self, path):
+        changed = set()
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), inotify_mask)
+        if wd < 0:
+            return changed
+        self.watches[wd] = os.path.normpath(path)
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    changed |= self._watch(entry.path)
+                else:
+                    changed.add(os.path.normpath(entry.path))
+        return changed
+
+    def wait(self, timeout=None):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = inotify_event.unpack_from(data, offset)
+            offset += inotify_event.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            watch_path = self.watches.get(wd)
+            if watch_path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                # editors that save by rename replace a watched file
+                if watch_path in self.paths and os.path.exists(watch_path):
+                    self._watch(watch_path)
+                changed.add(watch_path)
+                continue
+            path = os.path.join(watch_path, os.fsdecode(name)) if name else watch_path
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed |= self._watch(path)
+                continue
+            changed.add(os.path.normpath(path))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def watcher_create(paths):
+    try:
+        return InotifyWatcher(paths)
+    except OSError:
+        return PollWatcher(paths)
+
+def watch(base_path, template_path, src_dir, static_dir, dest_dir, jobs=1, debounce=0.1, static_mode="copy", static_checksum=False, fingerprint=False, minify=False, images=None, search=False, index=False, css_inline_max=None, cache=None, memo=None, compress_min_size=None):
+    graph = dependency_graph(template_path, src_dir, static_dir, dest_dir)
+    assets = assets_load(dest_dir)
+    watcher = watcher_create([src_dir, static_dir, template_path])
+    print(f"Watching {src_dir}, {static_dir} and {template_path} ({type(watcher).__name__})")
+    try:
+        while True:
+            changed = watcher.wait()
+            # coalesce bursts of editor saves into one rebuild
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+
+            cleanups = []
+            for path in changed:
+                cleanup = _graph_update(graph, path, template_path, src_dir, static_dir)
+                if cleanup is not None:
+                    cleanups.append(cleanup)
+            targets = graph.affected(changed)
+            pages = { rel for kind, rel in targets if kind == "page" }
+            changed_assets = { rel for kind, rel in targets if kind == "asset" }
+
+            start = time.perf_counter()
+            try:
+                if changed_assets:
+                    synced_assets = directory_sync(
+                        static_dir, dest_dir,
+                        mode=static_mode, checksum=static_checksum, fingerprint=fingerprint, minify=minify,
+                        only=changed_assets,
+                    )
+                    # new fingerprints change every page that may reference them
+                    if synced_assets != assets:
+                        assets = synced_assets
+                        pages = None
+                    elif css_inline_max is not None and any(rel.endswith(".css") for rel in changed_assets):
+                        # stylesheets may be inlined into every page
+                        pages = None
+                    elif images:
+                        pages |= _pages_using_images(dest_dir, changed_assets)
+                if pages is None or pages:
+                    pages_generate(
+                        base_path, template_path, src_dir, dest_dir,
+                        jobs=jobs, only=pages, cache=cache, assets=assets, minify=minify, images=images,
+                        search=search, index=index, memo=memo,
+                        css_dir=static_dir if css_inline_max is not None else None,
+                        css_inline_max=css_inline_max if css_inline_max is not None else 4096,
+                    )
+                if compress_min_size is not None and (pages is None or pages or changed_assets):
+                    directory_compress(dest_dir, jobs=max(jobs, 4), min_size=compress_min_size)
+            except Exception as e:
+                print(f"Rebuild failed: {e}")
+            for cleanup in cleanups:
+                cleanup()
+            if pages is None or pages or changed_assets:
+                elapsed = time.perf_counter() - start
+                page_count = "all" if pages is None else len(pages)
+                print(f"Rebuilt {page_count} page(s) and {len(changed_assets)} asset(s) in {elapsed:.3f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()